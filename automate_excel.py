@@ -1,14 +1,104 @@
 import openpyxl
+import numpy as np
 from openpyxl.styles import Font, PatternFill, Alignment, Border
-from openpyxl.utils import get_column_letter
+from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.cell import WriteOnlyCell, MergedCell
+from openpyxl.formula.tokenizer import Tokenizer, Token
+from openpyxl.formatting.formatting import ConditionalFormattingList
 import re
 import os
 from pathlib import Path
 from copy import copy
+from types import SimpleNamespace
 import csv
+import argparse
+import hashlib
+import pickle
+import json
+import io
+import zipfile
+import fnmatch
+import bisect
+import time
+import tracemalloc
+import cProfile
+import pstats
+import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from planning_history import update_history, missing_snapshots
 
-def find_jgal_file(jgal_folder, articolo, revisione):
+def open_input_folder(folder):
+    """
+    Open an input folder, which may also be a .zip bundle.
+
+    Returns a Path for a regular folder, or a zipfile.Path for a .zip file
+    ("bundle.zip" or "bundle.zip/subfolder"). Both support '/', .name,
+    .exists() and .open(), and zip members are read straight from the
+    archive (never extracted).
+    """
+    folder = Path(folder)
+    for idx, part in enumerate(folder.parts):
+        if part.lower().endswith('.zip'):
+            archive = Path(*folder.parts[:idx + 1])
+            if archive.is_file():
+                inner = '/'.join(folder.parts[idx + 1:])
+                return zipfile.Path(zipfile.ZipFile(archive), at=f"{inner}/" if inner else "")
+    return folder
+
+def open_input_file(path, mode='r', **kwargs):
+    """Open a file on disk or a member of a zip bundle (zipfile.Path)"""
+    if isinstance(path, zipfile.Path):
+        return path.open(mode, **kwargs)
+    return open(path, mode, **kwargs)
+
+def zip_member_files(folder, pattern):
+    """List the members of a zip bundle folder whose name matches pattern (central directory only)"""
+    prefix = folder.at
+    members = []
+    for name in folder.root.namelist():
+        if not name.startswith(prefix) or name.endswith('/'):
+            continue
+        member_name = name[len(prefix):]
+        if '/' not in member_name and fnmatch.fnmatch(member_name, pattern):
+            members.append(zipfile.Path(folder.root, at=name))
+    return members
+
+def find_planning_files(planning_folder):
+    """Return the Planning_*.xlsx files of a Planning folder or zip bundle, sorted by name"""
+    if isinstance(planning_folder, zipfile.Path):
+        return sorted(zip_member_files(planning_folder, "Planning_*.xlsx"), key=lambda pf: pf.name)
+    return sorted(planning_folder.glob("Planning_*.xlsx"))
+
+def build_jgal_index(jgal_folder):
+    """
+    Scan the jgal folder (or zip bundle) once and index its CSV files.
+
+    Returns a dict mapping the (normcase'd) file name to its path, so that
+    find_jgal_file() can resolve rows in memory instead of stat'ing the
+    folder twice per row (expensive on network shares). For a zip bundle
+    the index is built from the archive's central directory. A missing
+    folder gives an empty index (every row then reports no matching file).
+    """
+    jgal_index = {}
+    if isinstance(jgal_folder, zipfile.Path):
+        for member in zip_member_files(jgal_folder, "*"):
+            if member.name.lower().endswith('.csv'):
+                jgal_index[os.path.normcase(member.name)] = member
+        return jgal_index
+
+    if not os.path.isdir(jgal_folder):
+        print(f"WARNING: jgal folder {jgal_folder} not found, 'Data effettiva avanzamento' will stay empty")
+        return jgal_index
+
+    with os.scandir(jgal_folder) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith('.csv') and entry.is_file():
+                jgal_index[os.path.normcase(entry.name)] = Path(entry.path)
+    return jgal_index
+
+def find_jgal_file(jgal_folder, articolo, revisione, jgal_index=None, used_files=None):
     """
     Find the matching CSV file in jgal folder based on Articolo and Revisione.
 
@@ -17,50 +107,218 @@ def find_jgal_file(jgal_folder, articolo, revisione):
     2. If Revisione > 0: First try {Articolo}_rev{Revisione}.csv
     3. If not found or Revisione = 0: Try {Articolo}.csv
     4. Return the matched file path or None if not found
+
+    If both {Articolo}_rev0.csv and {Articolo}.csv exist for Revisione = 0 the
+    match is ambiguous and an exception is raised.
+
+    When jgal_index (from build_jgal_index) is given, lookups are done in
+    memory; the matched file names are added to used_files if provided.
     """
     # Convert to string and replace "/" with "_" for filesystem compatibility
     articolo_normalized = str(articolo).replace('/', '_')
 
+    def lookup(file_name):
+        if jgal_index is not None:
+            return jgal_index.get(os.path.normcase(file_name))
+        candidate = jgal_folder / file_name
+        return candidate if candidate.exists() else None
+
+    base_name = f"{articolo_normalized}.csv"
+    matched_file = None
+
     # Always try with revision suffix first (including _rev0)
     if revisione is not None:
-        rev_file = jgal_folder / f"{articolo_normalized}_rev{int(revisione)}.csv"
-        if rev_file.exists():
-            return rev_file
+        rev_file = lookup(f"{articolo_normalized}_rev{int(revisione)}.csv")
+        if rev_file:
+            if int(revisione) == 0 and lookup(base_name):
+                raise Exception(f"Ambiguous jgal files for Articolo={articolo}, Revisione=0: "
+                                f"both {rev_file.name} and {base_name} exist")
+            matched_file = rev_file
 
     # Try without revision suffix as fallback
-    base_file = jgal_folder / f"{articolo_normalized}.csv"
-    if base_file.exists():
-        return base_file
+    if not matched_file:
+        matched_file = lookup(base_name)
+
+    if matched_file and used_files is not None:
+        used_files.add(os.path.normcase(matched_file.name))
+
+    return matched_file
 
+def parse_jgal_date(date_str):
+    """Parse a jgal Data value (format DD/MM/YY); returns None if empty or invalid"""
+    if date_str:
+        try:
+            return datetime.strptime(date_str, '%d/%m/%y')
+        except ValueError:
+            # Try other common formats if needed
+            pass
     return None
 
-def extract_date_from_jgal_csv(csv_file):
+def scan_jgal_csv_fast(csv_file, sequences=('90',)):
     """
-    Extract the date from a jgal CSV file where Sequenza = 90.
+    Fast path for extract_dates_from_jgal_csv().
 
-    Returns a datetime object or None if not found.
+    Reads the header once to locate the 'Sequenza' and 'Data' columns, then
+    splits raw lines on ';' (no dict per row) and stops as soon as every
+    requested Sequenza has been seen.
+
+    Returns (True, {sequenza: date_or_None}) when the file was scanned, or
+    (False, None) when it needs the full csv module (quoted fields, bare CR
+    line endings, missing columns, short rows).
+    """
+    dates = dict.fromkeys(sequences)
+    remaining = set(sequences)
+
+    with open_input_file(csv_file, 'rb') as f:
+        header = f.readline().rstrip(b'\r\n')
+        if b'"' in header or b'\r' in header:
+            return False, None
+
+        fieldnames = header.decode('utf-8', errors='ignore').split(';')
+        if 'Sequenza' not in fieldnames or 'Data' not in fieldnames:
+            return False, None
+
+        # Like DictReader, the last column with a duplicated name wins
+        num_fields = len(fieldnames)
+        sequenza_idx = num_fields - 1 - fieldnames[::-1].index('Sequenza')
+        data_idx = num_fields - 1 - fieldnames[::-1].index('Data')
+        min_fields = max(sequenza_idx, data_idx) + 1
+
+        for raw_line in f:
+            line = raw_line.rstrip(b'\r\n')
+            if not line:
+                continue  # DictReader skips blank lines
+            if b'"' in line or b'\r' in line:
+                return False, None
+
+            fields = line.split(b';')
+            if len(fields) < min_fields:
+                return False, None
+
+            sequenza = fields[sequenza_idx].decode('utf-8', errors='ignore').strip()
+            if sequenza in remaining:
+                # Only the first row of each Sequenza counts
+                remaining.discard(sequenza)
+                dates[sequenza] = parse_jgal_date(fields[data_idx].decode('utf-8', errors='ignore').strip())
+                if not remaining:
+                    break
+
+    return True, dates
+
+def extract_dates_from_jgal_csv(csv_file, sequences=('90',)):
+    """
+    Extract the dates of several milestones from a jgal CSV file in one pass.
+
+    For each Sequenza in sequences, the Data of the first row with that
+    Sequenza is returned. The file is scanned with scan_jgal_csv_fast() first;
+    files the fast path cannot handle are read again with csv.DictReader.
+
+    Returns a dict {sequenza: datetime or None}.
     """
     try:
-        with open(csv_file, 'r', encoding='utf-8', errors='ignore') as f:
+        parsed, dates = scan_jgal_csv_fast(csv_file, sequences)
+        if parsed:
+            return dates
+
+        dates = dict.fromkeys(sequences)
+        remaining = set(sequences)
+
+        with open_input_file(csv_file, 'r', encoding='utf-8', errors='ignore') as f:
             reader = csv.DictReader(f, delimiter=';')
 
             for row in reader:
                 sequenza = row.get('Sequenza', '').strip()
-                if sequenza == '90':
-                    date_str = row.get('Data', '').strip()
-                    if date_str:
-                        # Parse date in format DD/MM/YY
-                        try:
-                            date_obj = datetime.strptime(date_str, '%d/%m/%y')
-                            return date_obj
-                        except ValueError:
-                            # Try other common formats if needed
-                            pass
-                    break
+                if sequenza in remaining:
+                    remaining.discard(sequenza)
+                    dates[sequenza] = parse_jgal_date(row.get('Data', '').strip())
+                    if not remaining:
+                        break
+        return dates
     except Exception as e:
         print(f"Error reading {csv_file}: {e}")
 
-    return None
+    return dict.fromkeys(sequences)
+
+def extract_date_from_jgal_csv(csv_file):
+    """
+    Extract the date from a jgal CSV file where Sequenza = 90.
+
+    Returns a datetime object or None if not found.
+    """
+    return extract_dates_from_jgal_csv(csv_file, ('90',))['90']
+
+def resolve_jgal_dates(jgal_folder, articolo, revisione, sequences=('90',), jgal_index=None, used_files=None,
+                       timings=None):
+    """
+    Find the jgal file of one row and extract its milestone dates.
+
+    Returns the {sequenza: date} map; raises if no matching file is found.
+    When timings is a list, the wall time of the lookup is appended to it
+    (also when it fails), whichever thread runs it.
+    """
+    start = time.perf_counter()
+    try:
+        matching_file = find_jgal_file(jgal_folder, articolo, revisione,
+                                       jgal_index=jgal_index, used_files=used_files)
+
+        if not matching_file:
+            raise Exception(f"No matching file found for Articolo={articolo}, Revisione={revisione}")
+
+        return extract_dates_from_jgal_csv(matching_file, sequences)
+    finally:
+        if timings is not None:
+            timings.append(time.perf_counter() - start)
+
+def prefetch_jgal_dates(executor, jgal_folder, source_ws, articolo_col_idx, revisione_col_idx,
+                        sequences=('90',), jgal_index=None, used_files=None, header_row=1, timings=None):
+    """
+    Submit resolve_jgal_dates() for every data row of the source sheet.
+
+    The jgal files are then read in the background (bounded by the executor's
+    worker count) while the copy and Planning stages run. Returns a dict
+    {(articolo, revisione): future} keyed by the values the lookup was made
+    for, so a consumer only uses a result computed for the same pair; rows
+    without Articolo are skipped and repeated pairs are submitted once.
+    """
+    futures = {}
+    for row_idx in range(header_row + 1, source_ws.max_row + 1):
+        articolo = source_ws.cell(row_idx, articolo_col_idx).value
+        revisione = source_ws.cell(row_idx, revisione_col_idx).value
+
+        if not articolo or (articolo, revisione) in futures:
+            continue
+
+        futures[(articolo, revisione)] = executor.submit(resolve_jgal_dates, jgal_folder, articolo, revisione,
+                                                         sequences, jgal_index, used_files, timings)
+    return futures
+
+def datetime_column_to_datetime64(values):
+    """
+    Convert a column of cell values to a datetime64[us] array for date
+    arithmetic. Values that are not datetimes map to NaT.
+
+    Differences floor-divided by one day give the same result as
+    (a - b).days on the datetimes.
+    """
+    dates = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[us]')
+    for idx, value in enumerate(values):
+        if value and hasattr(value, 'date'):
+            dates[idx] = value
+    return dates
+
+def last_valid_snapshot(planning_matrix):
+    """
+    For each row of a rows x snapshots datetime64 matrix (NaT for KOM,
+    missing and non-date values), return the index of the last snapshot
+    holding a valid date, or -1 if there is none.
+    """
+    num_rows, num_snapshots = planning_matrix.shape
+    if num_snapshots == 0:
+        return np.full(num_rows, -1)
+
+    valid = ~np.isnat(planning_matrix)
+    last_idx = num_snapshots - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return np.where(valid.any(axis=1), last_idx, -1)
 
 def extract_date_from_filename(filename):
     """Extract date from Planning filename in format Planning_yy_mm_dd.xlsx"""
@@ -70,9 +328,491 @@ def extract_date_from_filename(filename):
         return f"20{yy}-{mm}-{dd}"
     return None
 
-def copy_cell_style(source_cell, target_cell):
-    """Copy all style attributes from source to target cell"""
+def iter_planning_rows(planning_file):
+    """
+    Yield the (matricola, articolo, date) values of every data row of a Planning file.
+
+    The workbook is opened in read-only mode and streamed row by row, so only
+    the three columns we need are materialized:
+    Column 2 = Matricola, Column 4 = Articolo, Column 31 = Rilascio DiBa/Disegni (Mecc. + Idr.)
+    Data starts at row 5. Values are returned as stored in the workbook.
+    """
+    planning_data_start_row = 5  # Data starts at row 5
+
+    if isinstance(planning_file, tuple):
+        # (archive, member) reference to a Planning file inside a zip bundle
+        archive, member = planning_file
+        with zipfile.ZipFile(archive) as zf:
+            planning_file = io.BytesIO(zf.read(member))
+    elif isinstance(planning_file, zipfile.Path):
+        planning_file = io.BytesIO(planning_file.read_bytes())
+
+    planning_wb = openpyxl.load_workbook(planning_file, read_only=True, data_only=True)
+    try:
+        planning_ws = planning_wb.active
+
+        for row in planning_ws.iter_rows(min_row=planning_data_start_row, max_col=31, values_only=True):
+            # Short rows are not padded by the read-only reader
+            matricola_value = row[1] if len(row) > 1 else None   # Column 2 = Matricola
+            articolo_value = row[3] if len(row) > 3 else None    # Column 4 = Articolo
+            date_value = row[30] if len(row) > 30 else None      # Column 31 = Rilascio DiBa/Disegni
+            yield matricola_value, articolo_value, date_value
+    finally:
+        planning_wb.close()
+
+def load_planning_maps(planning_file, raw_rows=None):
+    """
+    Extract the Matricola -> date and Articolo -> date maps from a Planning file.
+
+    Returns a tuple (matricola_to_date, articolo_to_date). When raw_rows is a
+    list, the (matricola, articolo, date) rows read are also appended to it.
+    """
+    matricola_to_date = {}
+    articolo_to_date = {}
+
+    for matricola_value, articolo_value, date_value in iter_planning_rows(planning_file):
+        if raw_rows is not None:
+            raw_rows.append((matricola_value, articolo_value, date_value))
+
+        if matricola_value:
+            matricola_to_date[str(matricola_value).strip()] = date_value
+
+        if articolo_value:
+            articolo_to_date[str(articolo_value).strip()] = date_value
+
+    return matricola_to_date, articolo_to_date
+
+def parse_planning_file(planning_file, keep_rows=False):
+    """
+    Parse one Planning file with load_planning_maps() (the worker of
+    parse_planning_files()). Returns (maps, rows, seconds): the raw rows
+    read when keep_rows is True (None otherwise) and the parse wall time.
+    """
+    start = time.perf_counter()
+    raw_rows = [] if keep_rows else None
+    maps = load_planning_maps(planning_file, raw_rows)
+    return maps, raw_rows, time.perf_counter() - start
+
+def parse_planning_files(planning_files, jobs=1, raw_rows=None, parse_times=None):
+    """
+    Parse a list of Planning files with load_planning_maps().
+
+    With jobs > 1 the files are parsed in a process pool; jobs = 0 uses one
+    worker per CPU. Results are returned in the order of planning_files.
+
+    raw_rows optionally maps positions in planning_files to None; the raw
+    rows of those files are read in the same pass and stored in it. When
+    parse_times is a dict, the parse wall time of each file (measured in
+    the worker) is stored in it by position.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    raw_rows = raw_rows if raw_rows is not None else {}
+    keep_rows = [idx in raw_rows for idx in range(len(planning_files))]
+
+    if jobs > 1 and len(planning_files) > 1:
+        # zip members are passed to the workers as picklable (archive, member) pairs
+        planning_files = [(pf.root.filename, pf.at) if isinstance(pf, zipfile.Path) else pf
+                          for pf in planning_files]
+        # Workers are spawned, not forked: the jgal prefetch threads are already running
+        with ProcessPoolExecutor(max_workers=min(jobs, len(planning_files)),
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = list(executor.map(parse_planning_file, planning_files, keep_rows))
+    else:
+        results = [parse_planning_file(planning_file, keep) for planning_file, keep in zip(planning_files, keep_rows)]
+
+    for idx in raw_rows:
+        raw_rows[idx] = results[idx][1]
+    if parse_times is not None:
+        parse_times.update((idx, seconds) for idx, (_, _, seconds) in enumerate(results))
+    return [maps for maps, _, _ in results]
+
+def zip_member_fingerprint(member, sha256=None):
+    """Fingerprint of a zip bundle member: the archive entry's size and timestamp (central directory only)"""
+    info = member.root.getinfo(member.at)
+    return {
+        'path': f"{Path(member.root.filename).resolve()}!{member.at}",
+        'size': info.file_size,
+        'mtime_ns': int(datetime(*info.date_time).timestamp()) * 10**9,
+        'sha256': sha256,
+    }
+
+def jgal_file_fingerprints(jgal_index, names, fingerprints):
+    """
+    Return the fingerprints of the jgal files in names (normcase names from
+    build_jgal_index()); names no longer in the index map to None.
+
+    Files are stat'ed lazily and memoized in the fingerprints dict, so a run
+    only stats the jgal files its manifest records, once each, and never
+    the rest of the folder (one round trip per file on a network share).
+    """
+    result = {}
+    for name in sorted(names):
+        if name not in jgal_index:
+            result[name] = None
+            continue
+        if name not in fingerprints:
+            jgal_file = jgal_index[name]
+            if isinstance(jgal_file, zipfile.Path):
+                fingerprints[name] = zip_member_fingerprint(jgal_file)
+            else:
+                stat = jgal_file.stat()
+                fingerprints[name] = {
+                    'path': os.path.abspath(jgal_file),
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'sha256': None,
+                }
+        result[name] = fingerprints[name]
+    return result
+
+def input_file_fingerprint(planning_file, hash_contents=False):
+    """
+    Build the fingerprint of an input file (Planning file cache key, run
+    manifest entries): resolved path, size and mtime, plus the SHA-256 of
+    its contents when hash_contents is True.
+    """
+    sha256 = None
+    if hash_contents:
+        digest = hashlib.sha256()
+        with open_input_file(planning_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+
+    if isinstance(planning_file, zipfile.Path):
+        return zip_member_fingerprint(planning_file, sha256)
+
+    planning_file = Path(planning_file)
+    stat = planning_file.stat()
+
+    return {
+        'path': str(planning_file.resolve()),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256,
+    }
+
+def planning_cache_path(cache_dir, fingerprint):
+    """Return the cache entry path for a Planning file (one pickle per file)"""
+    name = hashlib.sha1(fingerprint['path'].encode('utf-8')).hexdigest()
+    return Path(cache_dir) / f"{name}.pkl"
+
+def read_planning_cache(cache_dir, fingerprint):
+    """
+    Return the cached (matricola_to_date, articolo_to_date) maps for a Planning
+    file, or None if there is no entry or the file changed since it was cached.
+    """
+    cache_file = planning_cache_path(cache_dir, fingerprint)
+    if not cache_file.exists():
+        return None
+
+    try:
+        with open(cache_file, 'rb') as f:
+            entry = pickle.load(f)
+    except Exception as e:
+        print(f"    Ignoring unreadable cache entry {cache_file}: {e}")
+        return None
+
+    cached = entry.get('fingerprint', {})
+    for key in ('path', 'size', 'mtime_ns'):
+        if cached.get(key) != fingerprint[key]:
+            return None
+    if fingerprint['sha256'] is not None and cached.get('sha256') != fingerprint['sha256']:
+        return None
+
+    return entry['maps']
+
+def write_planning_cache(cache_dir, fingerprint, maps):
+    """Store the maps of a Planning file in the cache (written atomically)"""
+    cache_file = planning_cache_path(cache_dir, fingerprint)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_file = cache_file.with_suffix('.tmp')
+    with open(tmp_file, 'wb') as f:
+        pickle.dump({'fingerprint': fingerprint, 'maps': maps}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+def load_all_planning_maps(planning_dates, jobs=1, cache_dir=None, cache_mode='use', hash_contents=False,
+                           raw_rows=None, parse_times=None):
+    """
+    Load the Matricola/Articolo -> date maps for every Planning file.
+
+    Files are parsed with parse_planning_files() (in parallel when jobs > 1).
+    Results are always returned in the order of planning_dates (filename-date
+    order), so the output does not depend on the worker count.
+
+    When cache_dir is set, parsed maps are kept on disk keyed by path, size,
+    mtime (and SHA-256 if hash_contents is True), so unchanged files are not
+    parsed again. cache_mode selects how the cache is used:
+    - 'use':     return cached maps, parse only new or changed files
+    - 'refresh': ignore existing entries, re-parse everything and rewrite them
+    - 'verify':  re-parse everything, report entries that differ from the
+                 fresh result, then rewrite them
+
+    raw_rows optionally maps positions in planning_dates to None; the raw rows
+    of those files are kept when they are parsed (cache hits stay None).
+    parse_times, when a dict, receives the parse wall time of every file
+    parsed, by position (cache hits are not in it).
+    """
+    planning_files = [planning_file for _, planning_file in planning_dates]
+
+    if not cache_dir:
+        return parse_planning_files(planning_files, jobs=jobs, raw_rows=raw_rows, parse_times=parse_times)
+
+    if cache_mode not in ('use', 'refresh', 'verify'):
+        raise ValueError(f"Unknown cache mode: {cache_mode}")
+
+    results = [None] * len(planning_files)
+    fingerprints = [input_file_fingerprint(pf, hash_contents) for pf in planning_files]
+    cached_maps = {}
+    to_parse = []
+
+    for idx, fingerprint in enumerate(fingerprints):
+        cached = None
+        if cache_mode != 'refresh':
+            cached = read_planning_cache(cache_dir, fingerprint)
+
+        if cached is not None:
+            cached_maps[idx] = cached
+        if cached is not None and cache_mode == 'use':
+            results[idx] = cached
+        else:
+            to_parse.append(idx)
+
+    parsed_rows = None
+    if raw_rows is not None:
+        parsed_rows = {pos: None for pos, idx in enumerate(to_parse) if idx in raw_rows}
+    parsed_times = {}
+    parsed = parse_planning_files([planning_files[idx] for idx in to_parse], jobs=jobs, raw_rows=parsed_rows,
+                                  parse_times=parsed_times)
+    for pos, rows in (parsed_rows or {}).items():
+        raw_rows[to_parse[pos]] = rows
+    if parse_times is not None:
+        parse_times.update((to_parse[pos], seconds) for pos, seconds in parsed_times.items())
+
+    mismatches = []
+    for idx, maps in zip(to_parse, parsed):
+        if cache_mode == 'verify' and idx in cached_maps and cached_maps[idx] != maps:
+            mismatches.append(planning_files[idx].name)
+        results[idx] = maps
+        write_planning_cache(cache_dir, fingerprints[idx], maps)
+
+    hits = len(cached_maps)
+    misses = len(planning_files) - hits
+    print(f"Planning cache ({cache_dir}, mode={cache_mode}): {hits} hits, {misses} misses, {len(to_parse)} files parsed")
+    if cache_mode == 'verify':
+        if mismatches:
+            print(f"  WARNING: {len(mismatches)} stale cache entries replaced:")
+            for name in mismatches:
+                print(f"    - {name}")
+        else:
+            print(f"  All {hits} cached entries match the Planning files")
+
+    return results
+
+def planning_maps_digest(maps):
+    """
+    Fingerprint the extracted (key, date) table of a Planning snapshot.
+
+    Two snapshots with the same digest have identical Matricola/Articolo ->
+    date maps, whatever changed in the other columns of the workbooks.
+    """
+    matricola_to_date, articolo_to_date = maps
+    digest = hashlib.sha256()
+    for table in (matricola_to_date, articolo_to_date):
+        digest.update(repr(sorted(table.items(), key=lambda item: item[0])).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def match_planning_date(target_matricola, target_articolo, matricola_to_date, articolo_to_date):
+    """
+    Look up the date of one row in the maps of a Planning file, matching by
+    Matricola first and by Articolo as fallback.
+
+    Returns a tuple (date_value, matched_by_matricola, matched_by_articolo).
+    A Matricola entry with an empty date still falls back to Articolo, in
+    which case both flags are set.
+    """
+    date_value = None
+    matched_by_matricola = False
+    matched_by_articolo = False
+
+    # Try matching by Matricola first
+    if target_matricola:
+        target_matricola = str(target_matricola).strip()
+        if target_matricola in matricola_to_date:
+            date_value = matricola_to_date[target_matricola]
+            matched_by_matricola = True
+
+    # If no match by Matricola, try Articolo
+    if not date_value and target_articolo:
+        target_articolo = str(target_articolo).strip()
+        if target_articolo in articolo_to_date:
+            date_value = articolo_to_date[target_articolo]
+            matched_by_articolo = True
+
+    return date_value, matched_by_matricola, matched_by_articolo
+
+def build_planning_key_index(planning_maps, duplicate_of=None):
+    """
+    Combine the maps of all Planning snapshots into one index per key type.
+
+    Each Matricola (and Articolo) key maps to a row of an int32 table with one
+    column per snapshot. Cells hold a code into a shared table of the distinct
+    date values (datetimes, 'KOM', other text), or -1 where the snapshot has
+    no entry for the key. The table has an extra all -1 row at the end, so
+    row index -1 can be used for keys that are not in the index.
+
+    duplicate_of maps a snapshot index to the earlier snapshot it is
+    identical to; its column is copied instead of being built again.
+
+    Returns (matricola_index, matricola_table, articolo_index, articolo_table, values).
+    """
+    duplicate_of = duplicate_of or {}
+    num_snapshots = len(planning_maps)
+    values = []
+    value_codes = {}
+
+    def value_code(value):
+        # The type is part of the key so that e.g. 1 and 1.0 keep their own code
+        key = (type(value), value)
+        if key not in value_codes:
+            value_codes[key] = len(values)
+            values.append(value)
+        return value_codes[key]
+
+    indexes = []
+    for map_idx in (0, 1):
+        key_index = {}
+        for idx, maps in enumerate(planning_maps):
+            if idx not in duplicate_of:
+                for key in maps[map_idx]:
+                    key_index.setdefault(key, len(key_index))
+
+        table = np.full((len(key_index) + 1, num_snapshots), -1, dtype=np.int32)
+        for idx, maps in enumerate(planning_maps):
+            if idx in duplicate_of:
+                table[:, idx] = table[:, duplicate_of[idx]]
+            elif maps[map_idx]:
+                key_to_date = maps[map_idx]
+                rows = [key_index[key] for key in key_to_date]
+                table[rows, idx] = [value_code(value) for value in key_to_date.values()]
+        indexes.extend((key_index, table))
+
+    return (*indexes, values)
+
+def resolve_planning_codes(planning_index, matricola_values, articolo_values, max_row):
+    """
+    Resolve every output row against all Planning snapshots at once.
+
+    Each row costs one Matricola and one Articolo lookup in the combined index
+    built by build_planning_key_index(); the per-snapshot rules of
+    match_planning_date() (Matricola first, Articolo when the Matricola entry
+    is missing or empty) are then applied to the whole rows x snapshots code
+    matrix.
+
+    Returns (codes, matches_by_matricola, matches_by_articolo): codes[row, idx]
+    is the value code of the row in snapshot idx (-1 where there is no
+    non-empty date), the counts are per snapshot.
+    """
+    matricola_index, matricola_table, articolo_index, articolo_table, values = planning_index
+
+    matricola_rows = np.full(max_row + 1, -1, dtype=np.int64)
+    articolo_rows = np.full(max_row + 1, -1, dtype=np.int64)
+    for row_idx in range(2, max_row + 1):  # Start from row 2 (skip header)
+        target_matricola = matricola_values[row_idx]
+        if target_matricola:
+            matricola_rows[row_idx] = matricola_index.get(str(target_matricola).strip(), -1)
+
+        target_articolo = articolo_values[row_idx]
+        if target_articolo:
+            articolo_rows[row_idx] = articolo_index.get(str(target_articolo).strip(), -1)
+
+    matricola_codes = matricola_table[matricola_rows]
+    articolo_codes = articolo_table[articolo_rows]
+
+    # Code -1 picks the trailing False
+    truthy = np.array([bool(value) for value in values] + [False])
+    has_matricola_date = truthy[matricola_codes]
+    matched_by_matricola = matricola_codes >= 0
+    matched_by_articolo = ~has_matricola_date & (articolo_codes >= 0)
+
+    codes = np.where(has_matricola_date, matricola_codes,
+                     np.where(matched_by_articolo & truthy[articolo_codes], articolo_codes, -1))
+
+    return codes, matched_by_matricola.sum(axis=0), matched_by_articolo.sum(axis=0)
+
+def consolidate_newest_first(planning_dates, matricola_values, articolo_values, max_row, jobs=1,
+                             cache_dir=None, cache_mode='use', hash_contents=False):
+    """
+    Find the last valid (non-KOM) Planning date of every row without loading
+    every Planning file.
+
+    Snapshots are evaluated newest-first, in batches of max(1, jobs) files
+    loaded with load_all_planning_maps(). A row is settled by the first
+    (i.e. newest) snapshot giving it a date; loading stops as soon as every
+    row that has a Matricola or Articolo is settled.
+
+    Returns a tuple ({row_idx: date}, number of Planning files opened).
+    """
+    pending = [row_idx for row_idx in range(2, max_row + 1)
+               if matricola_values[row_idx] or articolo_values[row_idx]]
+    consolidated = {}
+    batch_size = max(1, jobs or os.cpu_count() or 1)
+    remaining = list(reversed(planning_dates))
+    files_opened = 0
+    previous_digest = None
+
+    while pending and remaining:
+        batch, remaining = remaining[:batch_size], remaining[batch_size:]
+        batch_maps = load_all_planning_maps(batch, jobs=jobs, cache_dir=cache_dir,
+                                            cache_mode=cache_mode, hash_contents=hash_contents)
+        files_opened += len(batch)
+
+        for (date, planning_file), maps in zip(batch, batch_maps):
+            # A snapshot identical to the newer one cannot settle any pending row
+            digest = planning_maps_digest(maps)
+            if digest == previous_digest:
+                print(f"    {planning_file.name}: identical to the newer snapshot, skipped")
+                continue
+            previous_digest = digest
+
+            matricola_to_date, articolo_to_date = maps
+            still_pending = []
+            for row_idx in pending:
+                date_value, _, _ = match_planning_date(matricola_values[row_idx], articolo_values[row_idx],
+                                                    matricola_to_date, articolo_to_date)
+                if date_value and hasattr(date_value, 'year'):  # datetime object (not 'KOM' or other text)
+                    consolidated[row_idx] = date_value
+                else:
+                    still_pending.append(row_idx)
+
+            print(f"    {planning_file.name}: {len(pending) - len(still_pending)} rows settled, "
+                  f"{len(still_pending)} still without a date")
+            pending = still_pending
+            if not pending:
+                break
+
+    return consolidated, files_opened
+
+def copy_cell_style(source_cell, target_cell, style_cache=None):
+    """
+    Copy all style attributes from source to target cell.
+
+    With a style_cache dict (one per source/target workbook pair), each
+    distinct source style is copied only once; later cells with the same
+    style just reuse the style ids already registered in the target workbook.
+    """
     if source_cell.has_style:
+        if style_cache is not None:
+            style_key = tuple(source_cell._style)
+            cached_style = style_cache.get(style_key)
+            if cached_style is not None:
+                target_cell._style = copy(cached_style)
+                return
+
         target_cell.font = copy(source_cell.font)
         target_cell.border = copy(source_cell.border)
         target_cell.fill = copy(source_cell.fill)
@@ -80,347 +820,1408 @@ def copy_cell_style(source_cell, target_cell):
         target_cell.protection = copy(source_cell.protection)
         target_cell.alignment = copy(source_cell.alignment)
 
-def main():
-    # Define paths
-    base_path = Path("_ref/usbilli")
-    source_file = base_path / "Avanzamento schede 3° trimestre 2025.xlsx"
-    planning_folder = base_path / "Planning"
-    output_file = "Avanzamento_schede_automated.xlsx"
+        if style_cache is not None:
+            style_cache[style_key] = copy(target_cell._style)
 
-    # Get all Planning files and extract dates
-    planning_files = sorted(planning_folder.glob("Planning_*.xlsx"))
-    planning_dates = []
-    for pf in planning_files:
-        date = extract_date_from_filename(pf.name)
-        if date:
-            planning_dates.append((date, pf))
+CELL_REF_RE = re.compile(r'^(\$?)([A-Za-z]{1,3})(\$?)(\d+)$')
+COLUMN_REF_RE = re.compile(r'^(\$?)([A-Za-z]{1,3})$')
 
-    print(f"Found {len(planning_dates)} Planning files")
-    for date, pf in planning_dates:
-        print(f"  - {pf.name}: {date}")
+def shift_column(col_idx, removed_cols):
+    """
+    Return the new index of a column after removed_cols (sorted list) were
+    deleted, or None if the column itself was removed.
+    """
+    pos = bisect.bisect_left(removed_cols, col_idx)
+    if pos < len(removed_cols) and removed_cols[pos] == col_idx:
+        return None
+    return col_idx - pos
 
-    # Load source workbook
-    print(f"\nLoading source file: {source_file}")
-    source_wb = openpyxl.load_workbook(source_file)
-    source_ws = source_wb.active
+def shift_range_columns(range_ref, removed_cols):
+    """
+    Re-point an A1 reference without sheet name (cell, range or whole
+    column) after removed_cols were deleted. Ranges that span a removed
+    column shrink, as in Excel.
 
-    # Find columns to exclude
-    columns_to_exclude = []
-    header_row = 1  # Assuming headers are in row 1
+    Returns the new reference, the reference unchanged if it does not
+    address columns (row ranges, names, ...), or None if it only covered
+    removed columns.
+    """
+    parts = range_ref.split(':')
+    if len(parts) > 2:
+        return range_ref
+
+    parsed = []
+    for part in parts:
+        match = CELL_REF_RE.match(part) or COLUMN_REF_RE.match(part)
+        if not match:
+            return range_ref
+        parsed.append(match.groups())
+
+    cols = [column_index_from_string(groups[1].upper()) for groups in parsed]
+    low, high = min(cols), max(cols)
+
+    # Shrink the range to the columns that survive
+    while low <= high and shift_column(low, removed_cols) is None:
+        low += 1
+    while high >= low and shift_column(high, removed_cols) is None:
+        high -= 1
+    if low > high:
+        return None
 
-    for col_idx in range(1, source_ws.max_column + 1):
-        cell_value = source_ws.cell(header_row, col_idx).value
-        if cell_value and ("Data effettiva avanzamento" in str(cell_value) or
-                          "Data prevista avanzamento" in str(cell_value)):
-            columns_to_exclude.append(col_idx)
-            print(f"Column to exclude: {get_column_letter(col_idx)} - {cell_value}")
+    new_cols = [shift_column(low, removed_cols), shift_column(high, removed_cols)]
+    if cols[0] > cols[-1]:
+        new_cols.reverse()
 
-    # Create new workbook
-    new_wb = openpyxl.Workbook()
-    new_ws = new_wb.active
-    new_ws.title = source_ws.title
+    new_parts = []
+    for groups, new_col in zip(parsed, new_cols):
+        col_abs, _, row_abs, row = (groups + (None, None))[:4]
+        new_parts.append(f"{col_abs}{get_column_letter(new_col)}{row_abs or ''}{row or ''}")
+    return ':'.join(new_parts)
 
-    # Copy all data except excluded columns
-    print("\nCopying data and formatting...")
-    col_mapping = {}  # Maps old column index to new column index
-    new_col_idx = 1
+def shift_sqref_columns(sqref, removed_cols):
+    """Re-point a space separated list of ranges; ranges that only covered removed columns are dropped"""
+    shifted = [shift_range_columns(range_ref, removed_cols) for range_ref in str(sqref).split()]
+    return ' '.join(range_ref for range_ref in shifted if range_ref)
+
+def translate_formula_columns(formula, removed_cols, sheet_title=None, own_sheet=True):
+    """
+    Re-point the references of a formula after removed_cols of the sheet
+    named sheet_title were deleted.
 
-    for old_col_idx in range(1, source_ws.max_column + 1):
-        if old_col_idx in columns_to_exclude:
+    References without sheet name are only shifted when own_sheet is True
+    (the formula lives on that sheet). Returns the translated formula, or
+    None if it references a removed column.
+    """
+    try:
+        tokenizer = Tokenizer(formula)
+    except Exception:
+        return formula
+
+    for token in tokenizer.items:
+        if token.type != Token.OPERAND or token.subtype != Token.RANGE:
             continue
 
-        col_mapping[old_col_idx] = new_col_idx
-
-        # Copy column width
-        old_col_letter = get_column_letter(old_col_idx)
-        new_col_letter = get_column_letter(new_col_idx)
-        if old_col_letter in source_ws.column_dimensions:
-            new_ws.column_dimensions[new_col_letter].width = source_ws.column_dimensions[old_col_letter].width
-
-        # Copy all cells in this column
-        for row_idx in range(1, source_ws.max_row + 1):
-            source_cell = source_ws.cell(row_idx, old_col_idx)
-            target_cell = new_ws.cell(row_idx, new_col_idx)
-
-            # Copy value (but skip formulas that reference excluded columns)
-            cell_value = source_cell.value
-            if cell_value and isinstance(cell_value, str) and cell_value.startswith('='):
-                # This is a formula - check if it references excluded columns
-                skip_formula = False
-                for excluded_col in columns_to_exclude:
-                    excluded_letter = get_column_letter(excluded_col)
-                    if excluded_letter in cell_value:
-                        skip_formula = True
-                        break
+        sheet_prefix, _, range_ref = token.value.rpartition('!')
+        if sheet_prefix:
+            if sheet_prefix.strip("'").replace("''", "'") != sheet_title:
+                continue
+        elif not own_sheet:
+            continue
 
-                if skip_formula:
-                    # Clear the formula to avoid circular references
-                    target_cell.value = None
-                else:
-                    target_cell.value = cell_value
-            else:
-                target_cell.value = cell_value
+        shifted = shift_range_columns(range_ref, removed_cols)
+        if shifted is None:
+            return None
+        token.value = f"{sheet_prefix}!{shifted}" if sheet_prefix else shifted
 
-            # Copy style
-            copy_cell_style(source_cell, target_cell)
+    return tokenizer.render()
 
-        new_col_idx += 1
+# Relative row number of an A1 reference (not preceded by '$'); used to build formula cache keys
+RELATIVE_ROW_RE = re.compile(r'(?<![A-Za-z0-9_.$])(\$?[A-Za-z]{1,3})(\d+)(?![A-Za-z0-9_(])')
 
-    # Copy row heights
-    for row_idx in range(1, source_ws.max_row + 1):
-        if row_idx in source_ws.row_dimensions:
-            new_ws.row_dimensions[row_idx].height = source_ws.row_dimensions[row_idx].height
+def translate_formula_cached(formula, removed_cols, formula_cache, sheet_title=None, own_sheet=True):
+    """
+    translate_formula_columns() with a per-run cache.
 
-    # Add "Data prevista avanzamento" column for each Planning file
-    print(f"\nAdding {len(planning_dates)} 'Data prevista avanzamento' columns...")
+    Relative row numbers do not affect the column translation, so they are
+    masked out of the cache key: all cells of a filled-down (shared) formula
+    such as =H2-G2, =H3-G3, ... are tokenized and translated only once, and
+    the row numbers are put back into the cached result.
+    """
+    rows = []
 
-    # First, find the Matricola and Articolo columns in the new worksheet
-    matricola_col_idx = None
-    articolo_col_idx = None
-    for col_idx in range(1, new_ws.max_column + 1):
-        header_value = new_ws.cell(header_row, col_idx).value
-        if header_value == "Matricola":
-            matricola_col_idx = col_idx
-        elif header_value == "Articolo":
-            articolo_col_idx = col_idx
+    def mask_row(match):
+        rows.append(match.group(2))
+        return f"{match.group(1)}1"
 
-    if not matricola_col_idx or not articolo_col_idx:
-        print("ERROR: Could not find 'Matricola' or 'Articolo' column in source file!")
-        return None
+    template = RELATIVE_ROW_RE.sub(mask_row, formula)
+    key = (template, sheet_title, own_sheet)
 
-    print(f"Found 'Matricola' column at index {matricola_col_idx}")
-    print(f"Found 'Articolo' column at index {articolo_col_idx}")
+    if key not in formula_cache:
+        translated = translate_formula_columns(template, removed_cols, sheet_title, own_sheet)
+        # Row numbers can only be restored if the translation kept every masked reference
+        restorable = translated is None or len(RELATIVE_ROW_RE.findall(translated)) == len(rows)
+        formula_cache[key] = (translated, restorable)
 
-    for idx, (date, planning_file) in enumerate(planning_dates):
-        col_idx = new_col_idx + idx
-        col_letter = get_column_letter(col_idx)
+    translated, restorable = formula_cache[key]
+    if not restorable:
+        return translate_formula_columns(formula, removed_cols, sheet_title, own_sheet)
+    if translated is None or not rows:
+        return translated
 
-        # Set header
-        header_cell = new_ws.cell(header_row, col_idx)
-        if len(planning_dates) == 1:
-            header_cell.value = "Data prevista avanzamento"
-        else:
-            header_cell.value = f"Data prevista avanzamento ({date})"
+    restored_rows = iter(rows)
+    return RELATIVE_ROW_RE.sub(lambda match: f"{match.group(1)}{next(restored_rows)}", translated)
 
-        # Copy header style from first column
-        first_header = new_ws.cell(header_row, 1)
-        copy_cell_style(first_header, header_cell)
+def delete_columns_in_place(ws, columns_to_exclude):
+    """
+    Delete columns from a worksheet and re-point everything that refers to them.
 
-        # Set column width
-        new_ws.column_dimensions[col_letter].width = 20
+    Formulas (on every sheet of the workbook) are translated with
+    translate_formula_columns(); as in the copy path, formulas that reference
+    a removed column are cleared. Merged ranges, conditional formatting, data
+    validation, the auto filter, freeze panes and column widths are shifted.
+    """
+    removed_cols = sorted(columns_to_exclude)
+    if not removed_cols:
+        return
+
+    # Translate formulas before the cells move
+    formula_cache = {}
+    for sheet in ws.parent.worksheets:
+        own_sheet = sheet is ws
+        for row in sheet.iter_rows():
+            for cell in row:
+                if isinstance(cell.value, str) and cell.value.startswith('='):
+                    cell.value = translate_formula_cached(cell.value, removed_cols, formula_cache, ws.title, own_sheet)
+
+    # Merged ranges are re-created once the columns are gone
+    merged_ranges = [str(merged_range) for merged_range in ws.merged_cells.ranges]
+    for merged_range in merged_ranges:
+        ws.unmerge_cells(merged_range)
+
+    for col_idx in reversed(removed_cols):
+        ws.delete_cols(col_idx)
+
+    for merged_range in merged_ranges:
+        shifted = shift_range_columns(merged_range, removed_cols)
+        if shifted and ':' in shifted and len(set(shifted.split(':'))) > 1:
+            ws.merge_cells(shifted)
+
+    # Conditional formatting: ranges and rule formulas
+    conditional_formatting = ConditionalFormattingList()
+    for cf in ws.conditional_formatting:
+        sqref = shift_sqref_columns(cf.sqref, removed_cols)
+        if not sqref:
+            continue
+        for rule in cf.rules:
+            formulas = [translate_formula_columns(f"={formula}", removed_cols, ws.title) for formula in rule.formula]
+            if None in formulas:
+                continue
+            rule.formula = [formula[1:] for formula in formulas]
+            conditional_formatting.add(sqref, rule)
+    ws.conditional_formatting = conditional_formatting
+
+    # Data validation
+    for dv in list(ws.data_validations.dataValidation):
+        sqref = shift_sqref_columns(dv.sqref, removed_cols)
+        if not sqref:
+            ws.data_validations.dataValidation.remove(dv)
+            continue
+        dv.sqref = sqref
+        for attr in ('formula1', 'formula2'):
+            formula = getattr(dv, attr)
+            if formula:
+                shifted = translate_formula_columns(f"={formula}", removed_cols, ws.title)
+                setattr(dv, attr, shifted[1:] if shifted else None)
+
+    if ws.auto_filter.ref:
+        ws.auto_filter.ref = shift_range_columns(ws.auto_filter.ref, removed_cols)
+
+    if ws.freeze_panes:
+        match = CELL_REF_RE.match(ws.freeze_panes)
+        col_idx = column_index_from_string(match.group(2))
+        col_idx -= bisect.bisect_left(removed_cols, col_idx)
+        ws.freeze_panes = f"{get_column_letter(max(col_idx, 1))}{match.group(4)}"
+
+    # Column widths (and other column settings) stay keyed by letter, so move them too
+    dimensions = [(column_index_from_string(letter), dim) for letter, dim in ws.column_dimensions.items()]
+    for letter in list(ws.column_dimensions.keys()):
+        del ws.column_dimensions[letter]
+    for col_idx, dim in sorted(dimensions):
+        new_idx = shift_column(col_idx, removed_cols)
+        if new_idx is None:
+            continue
+        span = dim.max - dim.min if dim.min and dim.max else 0
+        new_letter = get_column_letter(new_idx)
+        dim.index = new_letter
+        dim.min = new_idx
+        dim.max = new_idx + span
+        ws.column_dimensions[new_letter] = dim
+
+def save_workbook_atomically(wb, output_file):
+    """
+    Save a workbook to a temporary file next to output_file, then rename it
+    over the target. A failed save (e.g. the output is open in Excel) leaves
+    the previous output untouched instead of a truncated file.
+    """
+    output_file = Path(output_file)
+    tmp_file = output_file.with_name(f"~{output_file.stem}.tmp{output_file.suffix}")
+    try:
+        wb.save(tmp_file)
+        os.replace(tmp_file, output_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+def write_template_workbook(output_file, source_ws, columns_to_exclude, output_columns, col_mapping,
+                            generated_header_cols, number_formats, column_widths):
+    """
+    In-place template mode: render the output by editing the source workbook.
 
-        print(f"  Processing column {col_letter}: {header_cell.value}")
+    The excluded columns are removed structurally with
+    delete_columns_in_place() (keeping conditional formatting, merged cells,
+    data validation and freeze panes), then the generated columns are
+    written after the remaining ones. Values the pipeline wrote into copied
+    columns (e.g. Delta) are the cells listed in number_formats.
+    """
+    header_row = 1
+    kept_width = len(col_mapping)
 
-        # Load Planning file and extract dates
-        print(f"    Loading Planning file: {planning_file}")
-        planning_wb = openpyxl.load_workbook(planning_file, data_only=True)
-        planning_ws = planning_wb.active
+    delete_columns_in_place(source_ws, columns_to_exclude)
 
-        # Build mappings from Planning file
-        # Column 2 = Matricola, Column 4 = Articolo, Column 31 = Rilascio DiBa/Disegni (Mecc. + Idr.)
-        matricola_to_date = {}
-        articolo_to_date = {}
-        planning_data_start_row = 5  # Data starts at row 5
-
-        for row_idx in range(planning_data_start_row, planning_ws.max_row + 1):
-            matricola_cell = planning_ws.cell(row_idx, 2)  # Column 2 = Matricola
-            articolo_cell = planning_ws.cell(row_idx, 4)   # Column 4 = Articolo
-            date_cell = planning_ws.cell(row_idx, 31)      # Column 31 = Rilascio DiBa/Disegni
-
-            if matricola_cell.value:
-                matricola = str(matricola_cell.value).strip()
-                date_value = date_cell.value
-                matricola_to_date[matricola] = date_value
-
-            if articolo_cell.value:
-                articolo = str(articolo_cell.value).strip()
-                date_value = date_cell.value
-                articolo_to_date[articolo] = date_value
-
-        print(f"    Found {len(matricola_to_date)} matricola and {len(articolo_to_date)} articolo entries in Planning file")
-
-        # Now populate the new worksheet by matching Matricola first, then Articolo as fallback
-        matches_by_matricola = 0
-        matches_by_articolo = 0
-        for row_idx in range(2, new_ws.max_row + 1):  # Start from row 2 (skip header)
-            target_matricola_cell = new_ws.cell(row_idx, matricola_col_idx)
-            target_articolo_cell = new_ws.cell(row_idx, articolo_col_idx)
-            target_date_cell = new_ws.cell(row_idx, col_idx)
-
-            date_value = None
-
-            # Try matching by Matricola first
-            if target_matricola_cell.value:
-                target_matricola = str(target_matricola_cell.value).strip()
-                if target_matricola in matricola_to_date:
-                    date_value = matricola_to_date[target_matricola]
-                    matches_by_matricola += 1
-
-            # If no match by Matricola, try Articolo
-            if not date_value and target_articolo_cell.value:
-                target_articolo = str(target_articolo_cell.value).strip()
-                if target_articolo in articolo_to_date:
-                    date_value = articolo_to_date[target_articolo]
-                    matches_by_articolo += 1
-
-            # Populate the cell if we found a match
-            if date_value:
-                target_date_cell.value = date_value
-                # Copy number format for dates
-                if date_value:
-                    target_date_cell.number_format = 'YYYY-MM-DD'
+    first_header = source_ws.cell(header_row, 1)
+    style_cache = {}
 
-        print(f"    Matched {matches_by_matricola} rows by Matricola, {matches_by_articolo} rows by Articolo")
+    for col_idx in range(kept_width + 1, len(output_columns)):
+        values = output_columns[col_idx]
+        for row_idx in range(1, len(values)):
+            if values[row_idx] is not None:
+                source_ws.cell(row_idx, col_idx).value = values[row_idx]
 
-        planning_wb.close()
+    for col_idx in generated_header_cols:
+        copy_cell_style(first_header, source_ws.cell(header_row, col_idx), style_cache)
 
-    # Add consolidated "Data prevista avanzamento" column (no date in label)
-    consolidated_col_idx = new_col_idx + len(planning_dates)
-    consolidated_col_letter = get_column_letter(consolidated_col_idx)
+    for (row_idx, col_idx), number_format in number_formats.items():
+        target_cell = source_ws.cell(row_idx, col_idx)
+        if isinstance(target_cell, MergedCell):
+            print(f"  Warning: skipping {target_cell.coordinate}, it is covered by a merged range")
+            continue
+        if col_idx <= kept_width:
+            target_cell.value = output_columns[col_idx][row_idx]
+        target_cell.number_format = number_format
 
-    consolidated_header = new_ws.cell(header_row, consolidated_col_idx)
-    consolidated_header.value = "Data prevista avanzamento"
+    for col_letter, width in column_widths.items():
+        if column_index_from_string(col_letter) > kept_width:
+            source_ws.column_dimensions[col_letter].width = width
 
-    first_header = new_ws.cell(header_row, 1)
-    copy_cell_style(first_header, consolidated_header)
-    new_ws.column_dimensions[consolidated_col_letter].width = 20
+    save_workbook_atomically(source_ws.parent, output_file)
 
-    print(f"\nAdding consolidated column {consolidated_col_letter}: Data prevista avanzamento")
+def write_output_workbook(output_file, source_ws, output_columns, col_mapping, generated_header_cols,
+                          number_formats, column_widths, row_heights, write_only=False):
+    """
+    Render the computed output sheet to an xlsx file.
 
-    # Populate consolidated column using the last Planning file date, ignoring 'KOM' values
-    consolidated_count = 0
-    for row_idx in range(2, new_ws.max_row + 1):  # Start from row 2 (skip header)
-        # Collect valid dates from the planning columns (ignore 'KOM' and non-date values)
-        # Start from the last planning file and work backwards
-        last_valid_date = None
+    output_columns holds plain values indexed [col_idx][row_idx] (1-based,
+    index 0 unused). Cells of copied columns take their style from the source cell
+    (col_mapping maps source column -> output column), generated header cells
+    take the style of the first header cell, and number_formats sets the
+    format of generated values.
 
-        for col_offset in range(len(planning_dates) - 1, -1, -1):  # Iterate backwards from last to first
-            date_col_idx = new_col_idx + col_offset
-            date_cell = new_ws.cell(row_idx, date_col_idx)
-            cell_value = date_cell.value
+    With write_only=True the rows are streamed once through a write-only
+    worksheet instead of building the full cell model in memory; column
+    widths, row heights and cell styles are preserved.
+    """
+    header_row = 1
+    source_cols = {new_idx: old_idx for old_idx, new_idx in col_mapping.items()}
+    first_header = source_ws.cell(header_row, source_cols[1]) if 1 in source_cols else None
+    header_style_cols = set(generated_header_cols)
+    style_cache = {}  # Source style -> style ids in the new workbook
+
+    if not write_only:
+        new_wb = openpyxl.Workbook()
+        new_ws = new_wb.active
+        new_ws.title = source_ws.title
+    else:
+        new_wb = openpyxl.Workbook(write_only=True)
+        new_ws = new_wb.create_sheet(source_ws.title)
+
+    # Column widths and row heights must be set before any write-only row is written
+    for col_letter, width in column_widths.items():
+        new_ws.column_dimensions[col_letter].width = width
+    for row_idx, height in row_heights.items():
+        new_ws.row_dimensions[row_idx].height = height
+
+    max_row = len(output_columns[1]) - 1 if len(output_columns) > 1 else 0
+    for row_idx in range(1, max_row + 1):
+        row_cells = []
+
+        for col_idx in range(1, len(output_columns)):
+            value = output_columns[col_idx][row_idx]
+            if col_idx in source_cols:
+                style_cell = source_ws.cell(row_idx, source_cols[col_idx])
+            elif row_idx == header_row and col_idx in header_style_cols:
+                style_cell = first_header
+            else:
+                style_cell = None
+            number_format = number_formats.get((row_idx, col_idx))
 
-            # Check if it's a valid date (not 'KOM' and not None)
-            if cell_value and str(cell_value).strip().upper() != 'KOM':
-                # Check if it's a datetime object (actual date)
-                if hasattr(cell_value, 'year'):  # datetime object
-                    last_valid_date = cell_value
-                    break
+            if style_cell is None and number_format is None:
+                if not write_only:
+                    if value is not None:
+                        new_ws.cell(row_idx, col_idx).value = value
+                else:
+                    row_cells.append(value)
+                continue
 
-        # Populate consolidated column if we found a valid date
-        if last_valid_date:
-            consolidated_cell = new_ws.cell(row_idx, consolidated_col_idx)
-            consolidated_cell.value = last_valid_date
-            consolidated_cell.number_format = 'YYYY-MM-DD'
-            consolidated_count += 1
+            if not write_only:
+                target_cell = new_ws.cell(row_idx, col_idx)
+                target_cell.value = value
+            else:
+                target_cell = WriteOnlyCell(new_ws, value)
+                row_cells.append(target_cell)
 
-    print(f"  Populated {consolidated_count} rows with consolidated dates (using last valid Planning date)")
+            if style_cell is not None:
+                copy_cell_style(style_cell, target_cell, style_cache)
+            if number_format is not None:
+                target_cell.number_format = number_format
 
-    # Add "Data effettiva avanzamento" column and populate from jgal CSV files
-    final_col_idx = consolidated_col_idx + 1
-    final_col_letter = get_column_letter(final_col_idx)
+        if write_only:
+            new_ws.append(row_cells)
 
-    final_header = new_ws.cell(header_row, final_col_idx)
-    final_header.value = "Data effettiva avanzamento"
+    save_workbook_atomically(new_wb, output_file)
 
-    first_header = new_ws.cell(header_row, 1)
-    copy_cell_style(first_header, final_header)
-    new_ws.column_dimensions[final_col_letter].width = 20
+def code_version():
+    """SHA-256 of the code that builds the report (this script and the modules it imports)"""
+    digest = hashlib.sha256()
+    for module_file in ('automate_excel.py', 'planning_history.py'):
+        digest.update((Path(__file__).parent / module_file).read_bytes())
+    return digest.hexdigest()
 
-    print(f"\nAdding and populating column {final_col_letter}: Data effettiva avanzamento")
+def run_manifest_path(output_file):
+    """The run manifest is stored next to the output file"""
+    return Path(output_file).with_suffix('.manifest.json')
 
-    # Find Articolo and Revisione columns
-    articolo_col_idx = None
-    revisione_col_idx = None
-    for col_idx in range(1, new_ws.max_column + 1):
-        header_value = new_ws.cell(header_row, col_idx).value
-        if header_value == "Articolo":
-            articolo_col_idx = col_idx
-        elif header_value == "Revisione":
-            revisione_col_idx = col_idx
+def build_run_manifest(source_file, planning_dates, jgal_index, consumed_jgal_files, options,
+                       jgal_fingerprints=None):
+    """
+    Describe the inputs of a run: code version, output options, the source
+    workbook, every Planning file, every jgal CSV consumed, and the names of
+    all jgal CSVs available (a new file may match a row that had none).
 
-    if not articolo_col_idx or not revisione_col_idx:
-        print("ERROR: Could not find 'Articolo' or 'Revisione' column!")
+    consumed_jgal_files are normcase names from jgal_index; names that are no
+    longer in the index are recorded as missing (None). Only the consumed
+    files are fingerprinted, memoized in jgal_fingerprints when given.
+    """
+    return {
+        'code_version': code_version(),
+        'options': options,
+        'source': input_file_fingerprint(source_file),
+        'planning': {pf.name: input_file_fingerprint(pf) for _, pf in planning_dates},
+        'jgal': jgal_file_fingerprints(jgal_index, consumed_jgal_files,
+                                       jgal_fingerprints if jgal_fingerprints is not None else {}),
+        'jgal_available': sorted(jgal_index),
+    }
+
+def read_run_manifest(manifest_file):
+    """Return the manifest of the previous run, or None if there is no usable one"""
+    try:
+        with open(manifest_file, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
         return None
 
-    # Process each row to extract "Data effettiva avanzamento"
-    jgal_folder = Path("_ref/jgal")
-    populated_count = 0
-    error_count = 0
-    errors = []
+def write_run_manifest(manifest_file, manifest):
+    """Store the run manifest (written atomically)"""
+    tmp_file = Path(manifest_file).with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+def compare_run_manifests(previous, current):
+    """Return a list describing every input that differs between two run manifests"""
+    changes = []
+    if previous.get('code_version') != current['code_version']:
+        changes.append("code version changed")
+    if previous.get('options') != current['options']:
+        changes.append("options changed")
+    if previous.get('source') != current['source']:
+        changes.append(f"source workbook changed: {current['source']['path']}")
+
+    for section, label in (('planning', 'Planning file'), ('jgal', 'jgal file')):
+        before = previous.get(section, {})
+        after = current[section]
+        for name in sorted(before.keys() | after.keys()):
+            if name not in before:
+                changes.append(f"{label} added: {name}")
+            elif after.get(name) is None:
+                changes.append(f"{label} removed: {name}")
+            elif before[name] != after[name]:
+                changes.append(f"{label} changed: {name}")
+
+    new_jgal_files = sorted(set(current['jgal_available']) - set(previous.get('jgal_available', [])))
+    for name in new_jgal_files:
+        changes.append(f"jgal file added: {name}")
+
+    return changes
+
+def start_stage(run_profile, name):
+    """
+    Start measuring a stage of main(); pass the returned record to end_stage().
 
-    for row_idx in range(2, new_ws.max_row + 1):
-        articolo = new_ws.cell(row_idx, articolo_col_idx).value
-        revisione = new_ws.cell(row_idx, revisione_col_idx).value
+    Wall and CPU time are always measured. The peak traced memory is recorded
+    when tracemalloc is tracing, and the stage runs under cProfile when
+    run_profile['profile_dir'] is set.
+    """
+    stage = {'stage': name, 'wall_start': time.perf_counter(), 'cpu_start': time.process_time()}
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    if run_profile['profile_dir']:
+        stage['profiler'] = cProfile.Profile()
+        stage['profiler'].enable()
+    run_profile['current_stage'] = stage
+    return stage
+
+def end_stage(run_profile, stage, **counters):
+    """Finish a stage started with start_stage() and add it, with its counters, to run_profile"""
+    wall_time = time.perf_counter() - stage['wall_start']
+    cpu_time = time.process_time() - stage['cpu_start']
+
+    record = {'stage': stage['stage'], 'wall_time_s': round(wall_time, 6), 'cpu_time_s': round(cpu_time, 6)}
+    if tracemalloc.is_tracing():
+        record['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+
+    if 'profiler' in stage:
+        stage['profiler'].disable()
+        profile_dir = Path(run_profile['profile_dir'])
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        stats_file = profile_dir / f"{len(run_profile['stages']) + 1:02d}_{stage['stage']}.pstats"
+        stage['profiler'].dump_stats(stats_file)
+        record['pstats_file'] = str(stats_file)
+
+    record['counters'] = counters
+    run_profile['stages'].append(record)
+    run_profile.pop('current_stage', None)
+
+def abort_stage(run_profile):
+    """Stop measuring when main() gives up: disable the running stage's profiler and stop tracing memory"""
+    stage = run_profile.pop('current_stage', None)
+    if stage and 'profiler' in stage:
+        stage['profiler'].disable()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def write_timing_report(run_profile, report_file):
+    """
+    Write the per-stage measurements of a run as JSON and print a summary.
 
-        if not articolo:
+    With profiling enabled the per-stage pstats files are also merged into
+    all_stages.pstats in the profile directory.
+    """
+    stages = run_profile['stages']
+    report = {
+        'started_at': run_profile['started_at'],
+        'python': platform.python_version(),
+        'tracemalloc': tracemalloc.is_tracing(),
+        'total_wall_time_s': round(sum(stage['wall_time_s'] for stage in stages), 6),
+        'total_cpu_time_s': round(sum(stage['cpu_time_s'] for stage in stages), 6),
+        'stages': stages,
+    }
+
+    if report_file:
+        tmp_file = Path(report_file).with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+        os.replace(tmp_file, report_file)
+
+    print(f"\nStage timings{f' (written to {report_file})' if report_file else ''}:")
+    for stage in stages:
+        memory = f"  peak {stage['peak_memory_bytes'] / 2**20:8.1f} MiB" if 'peak_memory_bytes' in stage else ""
+        print(f"  {stage['stage']:<16} wall {stage['wall_time_s']:8.3f} s  cpu {stage['cpu_time_s']:8.3f} s{memory}")
+        # Work done in worker processes/threads, which the stage wall time does not show
+        for counter, label in (('parse_time_s', 'Planning parse time, summed per file'),
+                               ('lookup_time_s', 'jgal lookup time, summed over lookups')):
+            if counter in stage['counters']:
+                print(f"  {'':<16} {label}: {stage['counters'][counter]:.3f} s")
+
+    stats_files = [stage['pstats_file'] for stage in stages if 'pstats_file' in stage]
+    if stats_files:
+        combined = pstats.Stats(*stats_files)
+        combined_file = Path(run_profile['profile_dir']) / "all_stages.pstats"
+        combined.dump_stats(combined_file)
+        print(f"  cProfile stats per stage and combined in {run_profile['profile_dir']} "
+              f"(e.g. python -m pstats {combined_file})")
+
+def build_run_metrics(run_profile, status, planning_files):
+    """
+    Summarize a run for monitoring: stage durations, Planning matches per
+    snapshot, consolidated and delta fill rates and jgal hits/misses/errors.
+    Stages restored from a checkpoint are not measured and are left out.
+    """
+    stages = {stage['stage']: stage for stage in run_profile['stages']}
+
+    def counters(name):
+        return stages[name]['counters'] if name in stages else {}
+
+    def fill_rate(name):
+        stage_counters = counters(name)
+        if not stage_counters.get('rows'):
+            return None
+        return round(stage_counters['populated'] / stage_counters['rows'], 4)
+
+    jgal = counters('jgal')
+    metrics = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'started_at': run_profile['started_at'],
+        'status': status,
+        'duration_seconds': round(time.perf_counter() - run_profile['wall_start'], 3),
+        'stage_duration_seconds': {name: stage['wall_time_s'] for name, stage in stages.items()},
+        'planning_files': planning_files,
+        'planning_duplicates': counters('planning_match').get('duplicates'),
+        'planning_matches': counters('planning_match').get('matches', {}),
+        'consolidated_fill_rate': fill_rate('consolidation'),
+        'delta_fill_rate': fill_rate('delta'),
+        'jgal': {},
+    }
+    if jgal:
+        metrics['jgal'] = {
+            'hits': jgal['populated'],
+            'misses': jgal['rows_looked_up'] - jgal['populated'] - jgal['errors'],
+            'errors': jgal['errors'],
+        }
+    return metrics
+
+def format_prometheus_metrics(metrics):
+    """Render run metrics in the node-exporter textfile collector format"""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+    lines = []
+
+    def add(name, help_text, samples, metric_type='gauge'):
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        lines.append(f"# HELP avanzamento_{name} {help_text}")
+        lines.append(f"# TYPE avanzamento_{name} {metric_type}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{escape(val)}"' for key, val in labels.items())
+            lines.append(f"avanzamento_{name}{{{label_text}}} {value}" if label_text else f"avanzamento_{name} {value}")
+
+    add('last_run_timestamp_seconds', 'Unix time of the end of the last run',
+        [({}, round(datetime.fromisoformat(metrics['timestamp']).timestamp()))])
+    add('last_run_status', 'Outcome of the last run (1 for the current status)',
+        [({'status': status}, int(metrics['status'] == status)) for status in ('completed', 'resumed', 'up_to_date', 'failed')])
+    add('run_duration_seconds', 'Wall time of the last run', [({}, metrics['duration_seconds'])])
+    add('stage_duration_seconds', 'Wall time of each stage of the last run',
+        [({'stage': name}, value) for name, value in metrics['stage_duration_seconds'].items()])
+    add('planning_files', 'Planning files found', [({}, metrics['planning_files'])])
+    add('planning_duplicate_snapshots', 'Planning snapshots identical to their predecessor',
+        [({}, metrics['planning_duplicates'])])
+    add('planning_matches', 'Output rows matched per Planning snapshot and key',
+        [({'snapshot': snapshot, 'key': key}, count)
+         for snapshot, matches in metrics['planning_matches'].items() for key, count in matches.items()])
+    add('consolidated_fill_ratio', 'Share of rows with a consolidated Data prevista', [({}, metrics['consolidated_fill_rate'])])
+    add('delta_fill_ratio', 'Share of rows with a Delta', [({}, metrics['delta_fill_rate'])])
+    add('jgal_rows', 'Rows by jgal lookup result', [({'result': result}, count) for result, count in metrics['jgal'].items()])
+    return '\n'.join(lines) + '\n'
+
+def write_run_metrics(metrics_file, run_profile, status, planning_files):
+    """
+    Emit the metrics of a run: a node-exporter textfile (replaced atomically)
+    when metrics_file ends in .prom, otherwise one JSON line appended per run.
+    """
+    metrics = build_run_metrics(run_profile, status, planning_files)
+    metrics_file = Path(metrics_file)
+
+    if metrics_file.suffix == '.prom':
+        tmp_file = metrics_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus_metrics(metrics))
+        os.replace(tmp_file, metrics_file)
+    else:
+        with open(metrics_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(metrics) + '\n')
+    print(f"Metrics written to {metrics_file}")
+
+# Stages of main() after which the computed state is checkpointed, in order
+CHECKPOINT_STAGES = ('planning', 'consolidated', 'effettiva', 'delta')
+
+def checkpoint_path(output_file):
+    """The checkpoint of an unfinished run is stored next to the output file"""
+    return Path(output_file).with_suffix('.checkpoint.pkl')
+
+def write_checkpoint(checkpoint_file, stage, manifest, state):
+    """Store the state computed up to stage (written atomically)"""
+    tmp_file = Path(checkpoint_file).with_suffix('.tmp')
+    try:
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({'stage': stage, 'manifest': manifest, 'state': state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, checkpoint_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+def read_checkpoint(checkpoint_file, source_file, planning_dates, jgal_index, options, jgal_fingerprints=None):
+    """
+    Return the checkpoint of a previous unfinished run as (stage, state), or
+    (None, None) if there is none or its inputs differ from the current ones
+    (compared like the run manifest).
+    """
+    if not Path(checkpoint_file).exists():
+        return None, None
+
+    try:
+        with open(checkpoint_file, 'rb') as f:
+            checkpoint = pickle.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable checkpoint {checkpoint_file}: {e}")
+        return None, None
+
+    current_manifest = build_run_manifest(source_file, planning_dates, jgal_index,
+                                          checkpoint['manifest'].get('jgal', {}), options, jgal_fingerprints)
+    changes = compare_run_manifests(checkpoint['manifest'], current_manifest)
+    if changes:
+        print(f"Ignoring checkpoint {checkpoint_file}, inputs changed since it was written ({len(changes)} changes)")
+        return None, None
+
+    return checkpoint['stage'], checkpoint['state']
+
+def stage_completed(resume_stage, stage):
+    """True if the checkpoint being resumed already contains the results of stage"""
+    return resume_stage is not None and CHECKPOINT_STAGES.index(resume_stage) >= CHECKPOINT_STAGES.index(stage)
+
+def write_backfill(backfill_dir, snapshot_dates, planning_matrix, snapshot_source, output_columns, number_formats,
+                   column_widths, new_col_idx, delta_col_idx, source_ws, col_mapping, row_heights,
+                   workbooks=False, write_only=False):
+    """
+    Rebuild the report as it would have looked on every Planning date.
+
+    The snapshots are walked in chronological order and the last valid
+    snapshot of every row is updated incrementally, so each snapshot is
+    visited once instead of re-running main() on the first k files. Actual
+    (jgal) dates after an as-of date are left out, since those deliveries had
+    not happened yet.
+
+    Writes backfill_summary.csv with one row per Planning date and, with
+    workbooks=True, one Avanzamento_schede_as_of_<date>.xlsx per date holding
+    the Planning columns up to that date.
+    """
+    backfill_dir = Path(backfill_dir)
+    backfill_dir.mkdir(parents=True, exist_ok=True)
+
+    header_row = 1
+    max_row = len(output_columns[1]) - 1
+    consolidated_col_idx = new_col_idx + len(snapshot_dates)
+    final_col_idx = consolidated_col_idx + 1
+    actual_col_idxs = list(range(final_col_idx, len(output_columns)))  # Effettiva and extra milestones
+    planning_columns = output_columns[new_col_idx:consolidated_col_idx]
+
+    effettiva_dates = datetime_column_to_datetime64(output_columns[final_col_idx])
+    actual_dates = {col_idx: datetime_column_to_datetime64(output_columns[col_idx]) for col_idx in actual_col_idxs}
+    snapshot_formats = [[row_idx for (row_idx, col_idx) in number_formats if col_idx == new_col_idx + idx]
+                        for idx in range(len(snapshot_dates))]
+    all_rows = np.arange(max_row + 1)
+
+    last_snapshot = np.full(max_row + 1, -1)
+    summary_rows = []
+    for idx, (date, planning_file) in enumerate(snapshot_dates):
+        # Incremental "last valid date" state: rows with a valid date in this snapshot move to it
+        valid = ~np.isnat(planning_matrix[:, idx])
+        valid[:2] = False  # Skip index 0 and the header row
+        last_snapshot[valid] = idx
+
+        prevista_dates = np.where(last_snapshot >= 0, planning_matrix[all_rows, last_snapshot],
+                                  np.datetime64('NaT'))
+        cutoff = np.datetime64(date) + np.timedelta64(1, 'D')
+        effettiva_as_of = np.where(effettiva_dates < cutoff, effettiva_dates, np.datetime64('NaT'))
+
+        has_delta = ~np.isnat(effettiva_as_of) & ~np.isnat(prevista_dates)
+        delta_rows = np.flatnonzero(has_delta)
+        delta_days = (effettiva_as_of[delta_rows] - prevista_dates[delta_rows]) // np.timedelta64(1, 'D')
+
+        summary_rows.append({
+            'as_of_date': date,
+            'planning_file': planning_file.name,
+            'rows_with_prevista': int(np.count_nonzero(last_snapshot >= 0)),
+            'rows_with_effettiva': int(np.count_nonzero(~np.isnat(effettiva_as_of[2:]))),
+            'rows_with_delta': len(delta_rows),
+            'on_time': int(np.count_nonzero(delta_days <= 0)),
+            'late': int(np.count_nonzero(delta_days > 0)),
+            'mean_delta': round(float(delta_days.mean()), 2) if len(delta_rows) else '',
+            'median_delta': float(np.median(delta_days)) if len(delta_rows) else '',
+        })
+
+        if not workbooks:
             continue
 
-        try:
-            # Find the matching CSV file
-            matching_file = find_jgal_file(jgal_folder, articolo, revisione)
-
-            if not matching_file:
-                raise Exception(f"No matching file found for Articolo={articolo}, Revisione={revisione}")
-
-            # Extract date from CSV file (Sequenza=90)
-            date_value = extract_date_from_jgal_csv(matching_file)
-
-            if date_value:
-                target_cell = new_ws.cell(row_idx, final_col_idx)
-                target_cell.value = date_value
-                target_cell.number_format = 'YYYY-MM-DD'
-                populated_count += 1
-
-        except Exception as e:
-            error_count += 1
-            errors.append(f"Row {row_idx} (Articolo={articolo}, Revisione={revisione}): {str(e)}")
-
-    print(f"  Populated {populated_count} rows")
-    if error_count > 0:
-        print(f"  Errors: {error_count}")
-        for err in errors[:10]:  # Show first 10 errors
-            print(f"    - {err}")
-
-    # Calculate and populate Delta column (Data effettiva - Data prevista)
-    print(f"\nCalculating Delta column (Data effettiva - Data prevista)...")
-
-    # Find Delta column
-    delta_col_idx = None
-    for col_idx in range(1, new_ws.max_column + 1):
-        header_value = new_ws.cell(header_row, col_idx).value
-        if header_value == "Delta":
-            delta_col_idx = col_idx
-            break
-
-    if delta_col_idx:
-        delta_populated = 0
-        for row_idx in range(2, new_ws.max_row + 1):
-            effettiva_val = new_ws.cell(row_idx, final_col_idx).value
-            prevista_val = new_ws.cell(row_idx, consolidated_col_idx).value
-
-            # Calculate delta if both dates exist
-            if effettiva_val and prevista_val:
-                try:
-                    # Ensure both are datetime objects
-                    if hasattr(effettiva_val, 'date') and hasattr(prevista_val, 'date'):
-                        delta_days = (effettiva_val - prevista_val).days
-                        delta_cell = new_ws.cell(row_idx, delta_col_idx)
-                        delta_cell.value = delta_days
-                        delta_cell.number_format = '0'  # Integer format
-                        delta_populated += 1
-                except Exception as e:
-                    pass  # Skip rows with calculation errors
-
-        print(f"  Populated {delta_populated} rows with delta values")
+        # As-of sheet: copied columns, the Planning columns up to this date, then the generated columns
+        consolidated_values = [None] * (max_row + 1)
+        consolidated_values[header_row] = output_columns[consolidated_col_idx][header_row]
+        for row_idx in np.flatnonzero(last_snapshot >= 0).tolist():
+            consolidated_values[row_idx] = planning_columns[snapshot_source[last_snapshot[row_idx]]][row_idx]
+
+        actual_values = []
+        for col_idx in actual_col_idxs:
+            values = list(output_columns[col_idx])
+            for row_idx in np.flatnonzero(actual_dates[col_idx] >= cutoff).tolist():
+                values[row_idx] = None
+            actual_values.append(values)
+
+        as_of_columns = output_columns[:new_col_idx] + planning_columns[:idx + 1] + [consolidated_values] + actual_values
+        as_of_consolidated_idx = new_col_idx + idx + 1
+        as_of_formats = {(row_idx, new_col_idx + snapshot_idx): 'YYYY-MM-DD'
+                         for snapshot_idx in range(idx + 1) for row_idx in snapshot_formats[snapshot_idx]}
+        for col_idx in range(as_of_consolidated_idx, len(as_of_columns)):
+            for row_idx in range(2, max_row + 1):
+                if as_of_columns[col_idx][row_idx] is not None:
+                    as_of_formats[(row_idx, col_idx)] = 'YYYY-MM-DD'
+
+        if delta_col_idx:
+            delta_values = list(output_columns[delta_col_idx])
+            delta_values[2:] = [None] * (max_row - 1)
+            for row_idx, days in zip(delta_rows.tolist(), delta_days.tolist()):
+                delta_values[row_idx] = days
+                as_of_formats[(row_idx, delta_col_idx)] = '0'  # Integer format
+            as_of_columns[delta_col_idx] = delta_values
+
+        as_of_widths = {col_letter: width for col_letter, width in column_widths.items()
+                        if column_index_from_string(col_letter) < new_col_idx}
+        for col_idx in range(new_col_idx, len(as_of_columns)):
+            as_of_widths[get_column_letter(col_idx)] = 20
+
+        as_of_file = backfill_dir / f"Avanzamento_schede_as_of_{date}.xlsx"
+        write_output_workbook(as_of_file, source_ws, as_of_columns, col_mapping,
+                              list(range(new_col_idx, len(as_of_columns))), as_of_formats, as_of_widths,
+                              row_heights, write_only=write_only)
+        print(f"  Wrote {as_of_file}")
+
+    summary_file = backfill_dir / "backfill_summary.csv"
+    with open(summary_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(summary_rows[0]) if summary_rows else ['as_of_date'])
+        writer.writeheader()
+        writer.writerows(summary_rows)
+    print(f"  Wrote {summary_file} ({len(summary_rows)} as-of dates)")
+
+def main(jobs=1, cache_dir=None, cache_mode='use', cache_hash=False, milestones=(), jgal_threads=8,
+         planning_source=None, jgal_source=None, write_only=False, template=False, consolidated_only=False,
+         collapse_unchanged=False, history_db=None, backfill_dir=None, backfill_workbooks=False, force=False,
+         restart=False, timing_report=None, profile_dir=None, metrics_file=None):
+    """
+    Build the report with build_report(). When metrics_file is set a run
+    metrics record is always written, with status 'failed' if the run
+    raised or gave up (returned None).
+    """
+    # Stage measurements; memory is only traced when a report or profile was asked for.
+    # build_report() sets 'status' and 'planning_files' for the metrics.
+    run_profile = {'started_at': datetime.now().isoformat(timespec='seconds'), 'wall_start': time.perf_counter(),
+                   'profile_dir': profile_dir, 'stages': [], 'status': None, 'planning_files': None}
+    try:
+        return build_report(run_profile, jobs=jobs, cache_dir=cache_dir, cache_mode=cache_mode,
+                            cache_hash=cache_hash, milestones=milestones, jgal_threads=jgal_threads,
+                            planning_source=planning_source, jgal_source=jgal_source, write_only=write_only,
+                            template=template, consolidated_only=consolidated_only,
+                            collapse_unchanged=collapse_unchanged, history_db=history_db,
+                            backfill_dir=backfill_dir, backfill_workbooks=backfill_workbooks, force=force,
+                            restart=restart, timing_report=timing_report, profile_dir=profile_dir)
+    finally:
+        if not run_profile['status']:
+            abort_stage(run_profile)
+        if metrics_file:
+            write_run_metrics(metrics_file, run_profile, run_profile['status'] or 'failed',
+                              run_profile['planning_files'])
+
+def build_report(run_profile, jobs=1, cache_dir=None, cache_mode='use', cache_hash=False, milestones=(),
+                 jgal_threads=8, planning_source=None, jgal_source=None, write_only=False, template=False,
+                 consolidated_only=False, collapse_unchanged=False, history_db=None, backfill_dir=None,
+                 backfill_workbooks=False, force=False, restart=False, timing_report=None, profile_dir=None):
+    # Define paths (Planning and jgal sources may be folders or .zip bundles)
+    base_path = Path("_ref/usbilli")
+    source_file = base_path / "Avanzamento schede 3° trimestre 2025.xlsx"
+    planning_folder = open_input_folder(planning_source or base_path / "Planning")
+    output_file = "Avanzamento_schede_automated.xlsx"
+
+    # Get all Planning files and extract dates
+    planning_files = find_planning_files(planning_folder)
+    planning_dates = []
+    for pf in planning_files:
+        date = extract_date_from_filename(pf.name)
+        if date:
+            planning_dates.append((date, pf))
+
+    print(f"Found {len(planning_dates)} Planning files")
+    run_profile['planning_files'] = len(planning_dates)
+    for date, pf in planning_dates:
+        print(f"  - {pf.name}: {date}")
+
+    # Skip the run when no input changed since the last one (see the run manifest)
+    jgal_folder = open_input_folder(jgal_source or "_ref/jgal")
+    jgal_index = build_jgal_index(jgal_folder)
+    jgal_fingerprints = {}  # Filled lazily, only for the jgal files a manifest records
+    manifest_file = run_manifest_path(output_file)
+    run_options = {
+        'milestones': list(milestones), 'planning_source': str(planning_source or ''),
+        'jgal_source': str(jgal_source or ''), 'write_only': write_only, 'template': template,
+        'consolidated_only': consolidated_only, 'collapse_unchanged': collapse_unchanged,
+        'history_db': str(history_db or ''), 'backfill_dir': str(backfill_dir or ''),
+        'backfill_workbooks': backfill_workbooks,
+    }
+    previous_manifest = read_run_manifest(manifest_file)
+    unfinished_run = checkpoint_path(output_file).exists()
+    if previous_manifest and Path(output_file).exists() and not unfinished_run:
+        current_manifest = build_run_manifest(source_file, planning_dates, jgal_index,
+                                              previous_manifest.get('jgal', {}), run_options, jgal_fingerprints)
+        changes = compare_run_manifests(previous_manifest, current_manifest)
+        if not changes and not force:
+            print(f"\n{output_file} is up to date (no input changed since the last run, see {manifest_file})")
+            run_profile['status'] = 'up_to_date'
+            return output_file
+        if changes:
+            print(f"\nInputs changed since the last run ({len(changes)}):")
+            for change in changes:
+                print(f"  - {change}")
+
+    if timing_report or profile_dir:
+        tracemalloc.start()
+
+    # Load source workbook
+    stage = start_stage(run_profile, 'source_load')
+    print(f"\nLoading source file: {source_file}")
+    source_wb = openpyxl.load_workbook(source_file)
+    source_ws = source_wb.active
+
+    # Find columns to exclude
+    columns_to_exclude = []
+    header_row = 1  # Assuming headers are in row 1
+
+    for col_idx in range(1, source_ws.max_column + 1):
+        cell_value = source_ws.cell(header_row, col_idx).value
+        if cell_value and ("Data effettiva avanzamento" in str(cell_value) or
+                          "Data prevista avanzamento" in str(cell_value)):
+            columns_to_exclude.append(col_idx)
+            print(f"Column to exclude: {get_column_letter(col_idx)} - {cell_value}")
+    end_stage(run_profile, stage, rows=source_ws.max_row, columns=source_ws.max_column,
+              excluded_columns=len(columns_to_exclude))
+
+    extra_milestones = [str(seq).strip() for seq in milestones if str(seq).strip() != '90']
+    extra_milestones = list(dict.fromkeys(extra_milestones))
+    sequences = ('90',) + tuple(extra_milestones)
+
+    # Resume from the checkpoint of a previous run that did not finish (e.g. the save failed)
+    checkpoint_file = checkpoint_path(output_file)
+    resume_stage, checkpoint_state = None, None
+    if restart:
+        Path(checkpoint_file).unlink(missing_ok=True)
+    else:
+        resume_stage, checkpoint_state = read_checkpoint(checkpoint_file, source_file, planning_dates,
+                                                         jgal_index, run_options, jgal_fingerprints)
+
+    # Everything the stages below compute lives in one namespace, which is what gets
+    # checkpointed and restored on resume
+    if resume_stage:
+        print(f"Resuming from checkpoint {checkpoint_file} (completed stage: {resume_stage})")
+        state = SimpleNamespace(**checkpoint_state)
+        # Snapshots are checkpointed by file name (zip members cannot be pickled)
+        planning_by_name = {pf.name: (date, pf) for date, pf in planning_dates}
+        snapshot_dates = [planning_by_name[name] for name in state.snapshot_names]
     else:
-        print("  Warning: Delta column not found")
+        state = SimpleNamespace(used_jgal_files=set(), consolidated_col_idx=None, final_col_idx=None,
+                                delta_col_idx=None)
+
+    def save_stage(stage):
+        # Checkpoint everything computed so far, together with the inputs it was computed from.
+        # The jgal prefetch threads may still be adding to used_jgal_files, so a copy is stored.
+        used_jgal_files = set(state.used_jgal_files)
+        manifest = build_run_manifest(source_file, planning_dates, jgal_index, used_jgal_files, run_options,
+                                      jgal_fingerprints)
+        write_checkpoint(checkpoint_file, stage, manifest, dict(vars(state), used_jgal_files=used_jgal_files))
+
+    history_rows = {}  # Raw rows of new Planning files for the history store, by snapshot position
+
+    # Start reading the jgal CSV files in the background; the results are
+    # collected when the "Data effettiva avanzamento" column is populated
+    jgal_executor = ThreadPoolExecutor(max_workers=max(1, jgal_threads))
+    jgal_futures = {}
+    jgal_timings = []  # Wall time of every jgal lookup, in whichever thread and stage it ran
+
+    # Same column choice as the effettiva stage (last matching header)
+    source_articolo_col = source_revisione_col = None
+    for col_idx in range(1, source_ws.max_column + 1):
+        header_value = source_ws.cell(header_row, col_idx).value
+        if header_value == "Articolo":
+            source_articolo_col = col_idx
+        elif header_value == "Revisione":
+            source_revisione_col = col_idx
+
+    if stage_completed(resume_stage, 'effettiva'):
+        pass  # The jgal dates are already in the checkpoint
+    elif source_articolo_col and source_revisione_col:
+        jgal_futures = prefetch_jgal_dates(jgal_executor, jgal_folder, source_ws, source_articolo_col,
+                                           source_revisione_col, sequences, jgal_index, state.used_jgal_files,
+                                           header_row, jgal_timings)
+        print(f"Prefetching jgal files for {len(jgal_futures)} Articolo/Revisione pairs ({jgal_threads} threads)")
+
+    if stage_completed(resume_stage, 'planning'):
+        print("\nResuming: planning stage restored from checkpoint")
+    else:
+        stage = start_stage(run_profile, 'column_copy')
+        # The output sheet is computed as plain values first and rendered to Excel once at the end.
+        # It is stored by column: state.output_columns[col_idx][row_idx] uses the same 1-based
+        # indices as the worksheet (index 0 is unused); state.number_formats holds the formats
+        # of generated values.
+        # In consolidated-only mode the per-snapshot columns are not generated
+        snapshot_dates = [] if consolidated_only else planning_dates
+        state.snapshot_names = [pf.name for _, pf in snapshot_dates]
+        kept_columns = [col_idx for col_idx in range(1, source_ws.max_column + 1) if col_idx not in columns_to_exclude]
+        state.new_col_idx = len(kept_columns) + 1  # First generated column
+        state.output_width = len(kept_columns) + len(snapshot_dates) + 2 + len(extra_milestones)
+        state.max_row = source_ws.max_row
+        state.output_columns = [[None] * (state.max_row + 1) for _ in range(state.output_width + 1)]
+        state.number_formats = {}
+        state.column_widths = {}
+        state.generated_header_cols = []
+
+        # Copy all data except excluded columns
+        print("\nCopying data and formatting...")
+        state.col_mapping = {}  # Maps old column index to new column index
+        for new_idx, old_col_idx in enumerate(kept_columns, 1):
+            state.col_mapping[old_col_idx] = new_idx
+
+            # Copy column width
+            old_col_letter = get_column_letter(old_col_idx)
+            if old_col_letter in source_ws.column_dimensions:
+                state.column_widths[get_column_letter(new_idx)] = source_ws.column_dimensions[old_col_letter].width
+
+        removed_cols = sorted(columns_to_exclude)
+        formula_cache = {}  # Translated formulas, shared by all cells of a filled-down formula
+        for old_col_idx, new_idx in state.col_mapping.items():
+            source_values = next(source_ws.iter_cols(min_col=old_col_idx, max_col=old_col_idx,
+                                                     min_row=1, max_row=state.max_row, values_only=True))
+            target_column = state.output_columns[new_idx]
+            for row_idx, cell_value in enumerate(source_values, 1):
+                # Copy value; formulas are re-pointed to the new column positions, and
+                # formulas that reference an excluded column are cleared to avoid
+                # circular references
+                if cell_value and isinstance(cell_value, str) and cell_value.startswith('='):
+                    cell_value = translate_formula_cached(cell_value, removed_cols, formula_cache, source_ws.title)
+                target_column[row_idx] = cell_value
+
+        # Copy row heights
+        state.row_heights = {}
+        for row_idx in range(1, state.max_row + 1):
+            if row_idx in source_ws.row_dimensions:
+                state.row_heights[row_idx] = source_ws.row_dimensions[row_idx].height
+
+        state.header_values = [column[header_row] for column in state.output_columns]
+        end_stage(run_profile, stage, rows=state.max_row, columns=len(state.col_mapping),
+                  distinct_formulas=len(formula_cache))
+
+        # Add "Data prevista avanzamento" column for each Planning file
+        print(f"\nAdding {len(snapshot_dates)} 'Data prevista avanzamento' columns...")
+
+        # First, find the Matricola and Articolo columns in the new worksheet
+        state.matricola_col_idx = None
+        state.articolo_col_idx = None
+        for col_idx in range(1, state.output_width + 1):
+            header_value = state.header_values[col_idx]
+            if header_value == "Matricola":
+                state.matricola_col_idx = col_idx
+            elif header_value == "Articolo":
+                state.articolo_col_idx = col_idx
+
+        if not state.matricola_col_idx or not state.articolo_col_idx:
+            print("ERROR: Could not find 'Matricola' or 'Articolo' column in source file!")
+            jgal_executor.shutdown(cancel_futures=True)
+            abort_stage(run_profile)
+            return None
+
+        print(f"Found 'Matricola' column at index {state.matricola_col_idx}")
+        print(f"Found 'Articolo' column at index {state.articolo_col_idx}")
+
+        # Parse all Planning files up front (in parallel when jobs > 1); the raw rows of the
+        # files not in the history store yet are kept from the same pass
+        stage = start_stage(run_profile, 'planning_load')
+        planning_maps = []
+        parse_times = {}
+        if history_db:
+            new_snapshots = {date for date, _ in missing_snapshots(history_db, snapshot_dates)}
+            history_rows = {idx: None for idx, (date, _) in enumerate(snapshot_dates) if date in new_snapshots}
+        if snapshot_dates:
+            print(f"Loading {len(snapshot_dates)} Planning files (jobs={jobs})...")
+            planning_maps = load_all_planning_maps(snapshot_dates, jobs=jobs, cache_dir=cache_dir,
+                                                   cache_mode=cache_mode, hash_contents=cache_hash,
+                                                   raw_rows=history_rows, parse_times=parse_times)
+        # Per-file parse times are measured in the workers (None for cache hits)
+        end_stage(run_profile, stage, files=len(snapshot_dates), jobs=jobs,
+                  parse_time_s=round(sum(parse_times.values()), 6),
+                  entries={pf.name: {'matricola': len(maps[0]), 'articolo': len(maps[1]),
+                                     'parse_time_s': round(parse_times[idx], 6) if idx in parse_times else None}
+                           for idx, ((_, pf), maps) in enumerate(zip(snapshot_dates, planning_maps))})
+
+        stage = start_stage(run_profile, 'planning_match')
+
+        # Snapshots whose (key, date) table is identical to their predecessor reuse its codes
+        # instead of being indexed again. state.snapshot_source[idx] is the snapshot whose output
+        # column holds the values of snapshot idx (itself unless it was collapsed).
+        duplicate_of = {}
+        state.snapshot_source = list(range(len(snapshot_dates)))
+        unchanged_since = {}
+        previous_digest = None
+        for idx, (date, planning_file) in enumerate(snapshot_dates):
+            digest = planning_maps_digest(planning_maps[idx])
+            if digest == previous_digest:
+                duplicate_of[idx] = idx - 1
+                unchanged_since[idx] = unchanged_since[idx - 1]
+                if collapse_unchanged:
+                    state.snapshot_source[idx] = state.snapshot_source[idx - 1]
+            else:
+                unchanged_since[idx] = date
+            previous_digest = digest
+
+        # One combined index over all snapshots; every output row is resolved with a single
+        # Matricola and Articolo lookup that covers all snapshot columns
+        planning_index = build_planning_key_index(planning_maps, duplicate_of)
+        codes, matches_by_matricola, matches_by_articolo = resolve_planning_codes(
+            planning_index, state.output_columns[state.matricola_col_idx],
+            state.output_columns[state.articolo_col_idx], state.max_row)
+
+        # Code -1 picks the trailing None / NaT
+        planning_values = planning_index[-1]
+        value_table = np.array(planning_values + [None], dtype=object)
+        datetime_table = np.full(len(planning_values) + 1, np.datetime64('NaT'), dtype='datetime64[us]')
+        for code, value in enumerate(planning_values):
+            if hasattr(value, 'year'):  # datetime object (not 'KOM' or other text)
+                datetime_table[code] = value
+
+        # rows x snapshots matrix of the matched dates; NaT for KOM and non-date values
+        state.planning_matrix = datetime_table[codes]
+
+        for idx, (date, planning_file) in enumerate(snapshot_dates):
+            col_idx = state.new_col_idx + idx
+            col_letter = get_column_letter(col_idx)
+
+            # Set header (styled like the first header cell)
+            if len(snapshot_dates) == 1:
+                state.header_values[col_idx] = "Data prevista avanzamento"
+            else:
+                state.header_values[col_idx] = f"Data prevista avanzamento ({date})"
+            state.generated_header_cols.append(col_idx)
+
+            # Set column width
+            state.column_widths[col_letter] = 20
+
+            if idx in duplicate_of and collapse_unchanged:
+                # Leave the column empty; the consolidated column reads the first identical snapshot
+                state.header_values[col_idx] = (f"{state.header_values[col_idx]} "
+                                                f"(unchanged since {unchanged_since[idx]})")
+
+            print(f"  Processing column {col_letter}: {state.header_values[col_idx]}")
+
+            # Extracted dates for this Planning file
+            print(f"    Planning file: {planning_file}")
+            matricola_to_date, articolo_to_date = planning_maps[idx]
+
+            print(f"    Found {len(matricola_to_date)} matricola and {len(articolo_to_date)} articolo entries in Planning file")
+
+            if idx in duplicate_of:
+                if collapse_unchanged:
+                    print(f"    Identical to previous snapshot, collapsed")
+                    continue
+                print(f"    Identical to previous snapshot, reused its matches")
+
+            # Populate the cells that got a match
+            snapshot_codes = codes[:, idx]
+            state.output_columns[col_idx][2:] = value_table[snapshot_codes[2:]].tolist()
+            for row_idx in np.flatnonzero(snapshot_codes >= 0).tolist():
+                state.number_formats[(row_idx, col_idx)] = 'YYYY-MM-DD'
+
+            print(f"    Matched {matches_by_matricola[idx]} rows by Matricola, {matches_by_articolo[idx]} rows by Articolo")
+
+        if snapshot_dates:
+            print(f"  Skipped {len(duplicate_of)} of {len(snapshot_dates)} snapshots as duplicates of their predecessor")
+        end_stage(run_profile, stage, rows=state.max_row - 1, snapshots=len(snapshot_dates), duplicates=len(duplicate_of),
+                  matches={pf.name: {'matricola': int(matches_by_matricola[idx]), 'articolo': int(matches_by_articolo[idx])}
+                           for idx, (_, pf) in enumerate(snapshot_dates)})
+        save_stage('planning')
+
+    # Append the Planning files not seen before to the history store; files whose rows were
+    # not kept above (cache hits, consolidated-only or resumed runs) are read again
+    if history_db:
+        parsed_rows = {snapshot_dates[idx][1].name: rows for idx, rows in history_rows.items() if rows is not None}
+        update_history(history_db, planning_dates,
+                       lambda pf: parsed_rows[pf.name] if pf.name in parsed_rows else iter_planning_rows(pf))
+
+    if stage_completed(resume_stage, 'consolidated'):
+        print("\nResuming: consolidated stage restored from checkpoint")
+    else:
+        stage = start_stage(run_profile, 'consolidation')
+        # Add consolidated "Data prevista avanzamento" column (no date in label)
+        state.consolidated_col_idx = state.new_col_idx + len(snapshot_dates)
+        consolidated_col_letter = get_column_letter(state.consolidated_col_idx)
+
+        state.header_values[state.consolidated_col_idx] = "Data prevista avanzamento"
+        state.generated_header_cols.append(state.consolidated_col_idx)
+        state.column_widths[consolidated_col_letter] = 20
+
+        print(f"\nAdding consolidated column {consolidated_col_letter}: Data prevista avanzamento")
+
+        # Populate consolidated column using the last Planning file date, ignoring 'KOM' values:
+        # the last valid snapshot of every row comes from one masked reduction over the matrix
+        consolidated_count = 0
+        consolidated_values = state.output_columns[state.consolidated_col_idx]
+        if consolidated_only:
+            # Newest-first and lazy: older Planning files are only opened for rows still without a date
+            print(f"  Evaluating {len(planning_dates)} Planning files newest-first (jobs={jobs})...")
+            consolidated_dates, files_opened = consolidate_newest_first(
+                planning_dates, state.output_columns[state.matricola_col_idx],
+                state.output_columns[state.articolo_col_idx], state.max_row, jobs=jobs, cache_dir=cache_dir, cache_mode=cache_mode, hash_contents=cache_hash)
+            print(f"  Opened {files_opened} of {len(planning_dates)} Planning files")
+        else:
+            planning_columns = state.output_columns[state.new_col_idx:state.new_col_idx + len(snapshot_dates)]
+            last_snapshot = last_valid_snapshot(state.planning_matrix)
+            last_snapshot[:2] = -1  # Skip index 0 and the header row
+            consolidated_dates = {row_idx: planning_columns[state.snapshot_source[last_snapshot[row_idx]]][row_idx]
+                                  for row_idx in np.flatnonzero(last_snapshot >= 0).tolist()}
+
+        for row_idx in sorted(consolidated_dates):
+            consolidated_values[row_idx] = consolidated_dates[row_idx]
+            state.number_formats[(row_idx, state.consolidated_col_idx)] = 'YYYY-MM-DD'
+            consolidated_count += 1
+
+        print(f"  Populated {consolidated_count} rows with consolidated dates (using last valid Planning date)")
+        end_stage(run_profile, stage, rows=state.max_row - 1, populated=consolidated_count,
+                  files_opened=files_opened if consolidated_only else len(snapshot_dates))
+        save_stage('consolidated')
+
+    if stage_completed(resume_stage, 'effettiva'):
+        print("\nResuming: effettiva stage restored from checkpoint")
+    else:
+        stage = start_stage(run_profile, 'jgal')
+        # Add "Data effettiva avanzamento" column and populate from jgal CSV files
+        state.final_col_idx = state.consolidated_col_idx + 1
+        final_col_letter = get_column_letter(state.final_col_idx)
+
+        state.header_values[state.final_col_idx] = "Data effettiva avanzamento"
+        state.generated_header_cols.append(state.final_col_idx)
+        state.column_widths[final_col_letter] = 20
+
+        print(f"\nAdding and populating column {final_col_letter}: Data effettiva avanzamento")
+
+        # Optional extra milestones (other Sequenza values), one column each after the main one.
+        # All milestones are read in the same pass over each jgal file. Readers of the report
+        # find its columns by exact header: the consolidated "Data prevista avanzamento" is the
+        # last column with that header and is directly followed by "Data effettiva avanzamento";
+        # it is only the second-to-last column when there are no milestone columns.
+        milestone_col_idx = {}
+        for idx, sequenza in enumerate(extra_milestones):
+            col_idx = state.final_col_idx + 1 + idx
+            milestone_col_idx[sequenza] = col_idx
+
+            state.header_values[col_idx] = f"Data effettiva avanzamento (Sequenza {sequenza})"
+            state.generated_header_cols.append(col_idx)
+            state.column_widths[get_column_letter(col_idx)] = 20
+
+            print(f"Adding and populating column {get_column_letter(col_idx)}: {state.header_values[col_idx]}")
+
+        # Find Articolo and Revisione columns
+        state.articolo_col_idx = None
+        revisione_col_idx = None
+        for col_idx in range(1, state.output_width + 1):
+            header_value = state.header_values[col_idx]
+            if header_value == "Articolo":
+                state.articolo_col_idx = col_idx
+            elif header_value == "Revisione":
+                revisione_col_idx = col_idx
+
+        if not state.articolo_col_idx or not revisione_col_idx:
+            print("ERROR: Could not find 'Articolo' or 'Revisione' column!")
+            jgal_executor.shutdown(cancel_futures=True)
+            abort_stage(run_profile)
+            return None
+
+        # Process each row to extract "Data effettiva avanzamento"
+        print(f"  Indexed {len(jgal_index)} jgal CSV files in {jgal_folder}")
+        populated_count = 0
+        milestone_populated = dict.fromkeys(extra_milestones, 0)
+        error_count = 0
+        errors = []
+
+        articolo_values = state.output_columns[state.articolo_col_idx]
+        revisione_values = state.output_columns[revisione_col_idx]
+        for row_idx in range(2, state.max_row + 1):
+            articolo = articolo_values[row_idx]
+            revisione = revisione_values[row_idx]
+
+            if not articolo:
+                continue
+
+            try:
+                # Find the matching CSV file and extract its dates (Sequenza=90 plus any
+                # extra milestones), using the prefetched result when there is one for the
+                # same Articolo/Revisione (a formula cell may differ from its source value)
+                if (articolo, revisione) in jgal_futures:
+                    milestone_dates = jgal_futures[(articolo, revisione)].result()
+                else:
+                    milestone_dates = resolve_jgal_dates(jgal_folder, articolo, revisione, sequences,
+                                                         jgal_index, state.used_jgal_files, jgal_timings)
+                date_value = milestone_dates['90']
+
+                if date_value:
+                    state.output_columns[state.final_col_idx][row_idx] = date_value
+                    state.number_formats[(row_idx, state.final_col_idx)] = 'YYYY-MM-DD'
+                    populated_count += 1
+
+                for sequenza in extra_milestones:
+                    if milestone_dates[sequenza]:
+                        state.output_columns[milestone_col_idx[sequenza]][row_idx] = milestone_dates[sequenza]
+                        state.number_formats[(row_idx, milestone_col_idx[sequenza])] = 'YYYY-MM-DD'
+                        milestone_populated[sequenza] += 1
+
+            except Exception as e:
+                error_count += 1
+                errors.append(f"Row {row_idx} (Articolo={articolo}, Revisione={revisione}): {str(e)}")
+
+        jgal_executor.shutdown(cancel_futures=True)
+
+        print(f"  Populated {populated_count} rows")
+        for sequenza in extra_milestones:
+            print(f"  Populated {milestone_populated[sequenza]} rows for Sequenza {sequenza}")
+        if error_count > 0:
+            print(f"  Errors: {error_count}")
+            for err in errors[:10]:  # Show first 10 errors
+                print(f"    - {err}")
+
+        unused_jgal_files = sorted(jgal_index[name].name for name in jgal_index.keys() - state.used_jgal_files)
+        if unused_jgal_files:
+            print(f"  jgal files not used by any row: {len(unused_jgal_files)}")
+            for name in unused_jgal_files[:10]:  # Show first 10 unused files
+                print(f"    - {name}")
+        rows_looked_up = sum(1 for row_idx in range(2, state.max_row + 1) if articolo_values[row_idx])
+        end_stage(run_profile, stage, rows=state.max_row - 1, rows_looked_up=rows_looked_up, populated=populated_count,
+                  errors=error_count, files_indexed=len(jgal_index), files_used=len(state.used_jgal_files),
+                  milestones_populated=milestone_populated,
+                  # The lookups mostly run in the prefetch threads during the earlier stages;
+                  # the stage wall time above is only the wait for their results
+                  lookups=len(jgal_timings), lookup_time_s=round(sum(jgal_timings), 6),
+                  max_lookup_s=round(max(jgal_timings, default=0), 6))
+        save_stage('effettiva')
+
+    if stage_completed(resume_stage, 'delta'):
+        print("\nResuming: delta stage restored from checkpoint")
+    else:
+        stage = start_stage(run_profile, 'delta')
+        delta_populated = 0
+        # Calculate and populate Delta column (Data effettiva - Data prevista)
+        print(f"\nCalculating Delta column (Data effettiva - Data prevista)...")
+
+        # Find Delta column
+        state.delta_col_idx = None
+        for col_idx in range(1, state.output_width + 1):
+            header_value = state.header_values[col_idx]
+            if header_value == "Delta":
+                state.delta_col_idx = col_idx
+                break
+
+        if state.delta_col_idx:
+            # Both date columns as datetime64 arrays (NaT where there is no datetime)
+            effettiva_dates = datetime_column_to_datetime64(state.output_columns[state.final_col_idx])
+            prevista_dates = datetime_column_to_datetime64(state.output_columns[state.consolidated_col_idx])
+            delta_values = state.output_columns[state.delta_col_idx]
+
+            # Calculate delta where both dates exist (floor division, like timedelta.days)
+            has_delta = ~np.isnat(effettiva_dates) & ~np.isnat(prevista_dates)
+            has_delta[:2] = False  # Skip index 0 and the header row
+            delta_rows = np.flatnonzero(has_delta)
+            delta_days = (effettiva_dates[delta_rows] - prevista_dates[delta_rows]) // np.timedelta64(1, 'D')
+
+            for row_idx, days in zip(delta_rows.tolist(), delta_days.tolist()):
+                delta_values[row_idx] = days
+                state.number_formats[(row_idx, state.delta_col_idx)] = '0'  # Integer format
+                delta_populated += 1
+
+            print(f"  Populated {delta_populated} rows with delta values")
+        else:
+            print("  Warning: Delta column not found")
+        end_stage(run_profile, stage, rows=state.max_row - 1, populated=delta_populated)
+        save_stage('delta')
 
     # Save the new workbook
-    print(f"\nSaving output file: {output_file}")
-    new_wb.save(output_file)
+    for col_idx in range(1, state.output_width + 1):
+        state.output_columns[col_idx][header_row] = state.header_values[col_idx]
+
+    if backfill_dir:
+        stage = start_stage(run_profile, 'backfill')
+        print(f"\nBackfilling as-of reports for {len(snapshot_dates)} Planning dates into {backfill_dir}...")
+        write_backfill(backfill_dir, snapshot_dates, state.planning_matrix, state.snapshot_source,
+                       state.output_columns, state.number_formats, state.column_widths, state.new_col_idx,
+                       state.delta_col_idx, source_ws, state.col_mapping, state.row_heights,
+                       workbooks=backfill_workbooks, write_only=write_only)
+        end_stage(run_profile, stage, dates=len(snapshot_dates), workbooks=backfill_workbooks)
+
+    stage = start_stage(run_profile, 'save')
+    if template:
+        print(f"\nSaving output file: {output_file} (in-place template)")
+        write_template_workbook(output_file, source_ws, columns_to_exclude, state.output_columns, state.col_mapping,
+                                state.generated_header_cols, state.number_formats, state.column_widths)
+    else:
+        print(f"\nSaving output file: {output_file}" + (" (write-only)" if write_only else ""))
+        write_output_workbook(output_file, source_ws, state.output_columns, state.col_mapping,
+                              state.generated_header_cols, state.number_formats, state.column_widths, state.row_heights, write_only=write_only)
+
+    write_run_manifest(manifest_file, build_run_manifest(source_file, planning_dates, jgal_index,
+                                                         state.used_jgal_files, run_options, jgal_fingerprints))
+    Path(checkpoint_file).unlink(missing_ok=True)
+    end_stage(run_profile, stage, rows=state.max_row, columns=state.output_width,
+              mode='template' if template else 'write-only' if write_only else 'default')
+
+    if timing_report or profile_dir:
+        write_timing_report(run_profile, timing_report)
+        tracemalloc.stop()
+    run_profile['status'] = 'resumed' if resume_stage else 'completed'
     print("Done!")
 
     return output_file
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build Avanzamento_schede_automated.xlsx from the source and Planning files")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of processes used to parse Planning files (0 = one per CPU, default: 1)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory for the Planning parse cache (e.g. .planning_cache); disabled if omitted")
+    parser.add_argument("--cache-mode", choices=["use", "refresh", "verify"], default="use",
+                        help="use = reuse unchanged entries, refresh = rebuild all entries, "
+                             "verify = re-parse and report stale entries (default: use)")
+    parser.add_argument("--cache-hash", action="store_true",
+                        help="Also key cache entries on the SHA-256 of each Planning file")
+    parser.add_argument("--milestones", default="",
+                        help="Comma-separated extra jgal Sequenza values to extract, one "
+                             "'Data effettiva avanzamento (Sequenza N)' column each (e.g. 10,50,100)")
+    parser.add_argument("--jgal-threads", type=int, default=8,
+                        help="Number of threads reading jgal CSV files in the background (default: 8)")
+    parser.add_argument("--planning", default=None,
+                        help="Planning folder or .zip bundle (default: _ref/usbilli/Planning)")
+    parser.add_argument("--jgal", default=None,
+                        help="jgal CSV folder or .zip bundle (default: _ref/jgal)")
+    output_mode = parser.add_mutually_exclusive_group()
+    output_mode.add_argument("--write-only", action="store_true",
+                             help="Stream the output rows through a write-only worksheet (lower peak memory)")
+    output_mode.add_argument("--template", action="store_true",
+                             help="Edit the source workbook in place: delete the excluded columns structurally "
+                                  "(keeping conditional formatting, merged cells, data validation, freeze panes)")
+    parser.add_argument("--collapse-unchanged", action="store_true",
+                        help="Leave the column of a snapshot identical to its predecessor empty and mark its "
+                             "header '(unchanged since <date>)'")
+    parser.add_argument("--history-db", default=None,
+                        help="SQLite Planning history store (e.g. planning_history.sqlite); new Planning files "
+                             "are appended to it, query it with planning_history.py")
+    parser.add_argument("--consolidated-only", action="store_true",
+                        help="Only generate the consolidated 'Data prevista avanzamento' column (no per-snapshot "
+                             "columns); Planning files are read newest-first and only until every row has a date")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild the output even if no input changed since the last run")
+    parser.add_argument("--restart", action="store_true",
+                        help="Discard the checkpoint of an unfinished run instead of resuming from it")
+    parser.add_argument("--timing-report", default=None, metavar="FILE",
+                        help="Write wall/CPU time, peak traced memory and counters of each stage to a JSON file")
+    parser.add_argument("--profile", default=None, metavar="DIR",
+                        help="Run each stage under cProfile and dump its pstats (plus a combined file) to DIR")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help="Emit run metrics for a scheduler: a node-exporter textfile if FILE ends in .prom "
+                             "(replaced each run), otherwise one JSON line per run appended to FILE")
+    parser.add_argument("--backfill", default=None, metavar="DIR",
+                        help="Also write backfill_summary.csv to DIR: one row of KPIs per Planning date, "
+                             "as the report would have looked on that date")
+    parser.add_argument("--backfill-workbooks", action="store_true",
+                        help="With --backfill, also write one as-of workbook per Planning date")
+    args = parser.parse_args()
+    if args.backfill and args.consolidated_only:
+        parser.error("--backfill needs the per-snapshot columns and cannot be combined with --consolidated-only")
+    if args.backfill_workbooks and not args.backfill:
+        parser.error("--backfill-workbooks requires --backfill")
+
+    main(jobs=args.jobs, cache_dir=args.cache_dir, cache_mode=args.cache_mode, cache_hash=args.cache_hash,
+         milestones=[seq for seq in args.milestones.split(',') if seq.strip()], jgal_threads=args.jgal_threads,
+         planning_source=args.planning, jgal_source=args.jgal, write_only=args.write_only,
+         template=args.template, consolidated_only=args.consolidated_only,
+         collapse_unchanged=args.collapse_unchanged, history_db=args.history_db,
+         backfill_dir=args.backfill, backfill_workbooks=args.backfill_workbooks, force=args.force,
+         restart=args.restart, timing_report=args.timing_report, profile_dir=args.profile,
+         metrics_file=args.metrics)
@@ -0,0 +1,288 @@
+import openpyxl
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SOURCE_HEADERS = ['Articolo', 'Revisione', 'Enduser', 'Modello', 'Commessa - sottocommessa', 'Matricola',
+                  'Data prevista avanzamento', 'Data effettiva avanzamento', 'Delta', 'Commenti']
+RESULT_FIELDS = ['commit', 'timestamp', 'rows', 'planning_files', 'jgal_files', 'stage',
+                 'wall_time_s', 'cpu_time_s', 'peak_rss_mib', 'error']
+
+def write_jgal_file(path, articolo, actual):
+    """Write a ';'-delimited jgal CSV whose phases end around the actual delivery date"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("Articolo;Sequenza;Descrizione;Data\n")
+        for sequenza in (10, 50, 90, 100):
+            phase_date = actual + timedelta(days=sequenza // 10 - 9)
+            f.write(f"{articolo};{sequenza};Fase {sequenza};{phase_date:%d/%m/%y}\n")
+
+def generate_inputs(root, num_rows, num_planning, num_jgal=None, seed=0, kom_rate=0.1):
+    """
+    Generate a synthetic quarter under root with the layout main() expects:
+    - _ref/usbilli/Avanzamento schede 3° trimestre 2025.xlsx with num_rows rows
+    - num_planning weekly _ref/usbilli/Planning/Planning_yy_mm_dd.xlsx files
+      (data from row 5, Matricola in column 2, Articolo in column 4, date in column 31, some KOM)
+    - _ref/jgal/<Articolo>[_revN].csv ';'-delimited files with Sequenza/Data columns:
+      about 90% of the rows have one when num_jgal is None; otherwise exactly
+      num_jgal files, for randomly chosen rows and, past one file per row,
+      for Articoli not in the source workbook
+
+    Returns the number of jgal files written.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    planning_folder = root / "_ref" / "usbilli" / "Planning"
+    jgal_folder = root / "_ref" / "jgal"
+    planning_folder.mkdir(parents=True, exist_ok=True)
+    jgal_folder.mkdir(parents=True, exist_ok=True)
+
+    # Source workbook: a few Articoli repeat with other revisions, some rows have no Matricola
+    rows = []
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(SOURCE_HEADERS)
+    for idx in range(num_rows):
+        articolo = f"ART_{idx % max(1, num_rows * 3 // 4):05d}"
+        if idx % 29 == 0:
+            articolo += "/A"
+        revisione = rng.choice([0, 0, 0, 1, 2])
+        matricola = 22500000 + idx if rng.random() < 0.8 else None
+        rows.append((articolo, revisione, matricola))
+        ws.append([articolo, revisione, 'Enduser', 'Modello', 'C.1', matricola, None, None,
+                   f'=H{idx + 2}-G{idx + 2}', None])
+    wb.save(root / "_ref" / "usbilli" / "Avanzamento schede 3° trimestre 2025.xlsx")
+
+    # Weekly Planning snapshots; dates drift a little from one week to the next
+    base_date = datetime(2025, 7, 4)
+    planned = {idx: datetime(2025, 8, 1) + timedelta(days=rng.randint(0, 90)) for idx in range(num_rows)}
+    for week in range(num_planning):
+        snapshot_date = base_date + timedelta(days=7 * week)
+        pw = openpyxl.Workbook()
+        ps = pw.active
+        for _ in range(4):  # Header rows, data starts at row 5
+            ps.append(['Header'] * 31)
+        for idx, (articolo, revisione, matricola) in enumerate(rows):
+            if rng.random() < 0.1:
+                continue  # Not in this snapshot
+            if rng.random() < 0.15:
+                planned[idx] += timedelta(days=rng.randint(-7, 14))
+            row = [None] * 31
+            row[1] = matricola
+            row[3] = articolo
+            row[30] = 'KOM' if rng.random() < kom_rate else planned[idx]
+            ps.append(row)
+        pw.save(planning_folder / f"Planning_{snapshot_date:%y_%m_%d}.xlsx")
+
+    # jgal CSVs: revision files (_revN) for most rows, bare files for some revision 0 rows
+    jgal_names = set()
+    row_order = list(range(num_rows))
+    if num_jgal is not None:
+        rng.shuffle(row_order)
+    for idx in row_order:
+        articolo, revisione, matricola = rows[idx]
+        if num_jgal is None and rng.random() < 0.1:
+            continue  # No jgal file for this row
+        if num_jgal is not None and len(jgal_names) >= num_jgal:
+            break
+        safe_articolo = articolo.replace('/', '_')
+        if revisione == 0 and rng.random() < 0.3:
+            name = f"{safe_articolo}.csv"
+        else:
+            name = f"{safe_articolo}_rev{revisione}.csv"
+        if name in jgal_names or (name.endswith('_rev0.csv') and f"{safe_articolo}.csv" in jgal_names) \
+                or (name == f"{safe_articolo}.csv" and f"{safe_articolo}_rev0.csv" in jgal_names):
+            continue  # Keep the revision lookup unambiguous
+        jgal_names.add(name)
+
+        write_jgal_file(jgal_folder / name, articolo, planned[idx] + timedelta(days=rng.randint(-10, 20)))
+
+    # Files of other Articoli, listed by the jgal index but never looked up
+    extra = 0
+    while num_jgal is not None and len(jgal_names) < num_jgal:
+        name = f"OTHER_{extra:06d}_rev0.csv"
+        extra += 1
+        jgal_names.add(name)
+        write_jgal_file(jgal_folder / name, name[:-9], datetime(2025, 8, 1) + timedelta(days=rng.randint(0, 90)))
+
+    return len(jgal_names)
+
+def run_case(case_dir, stage):
+    """
+    Time one stage in the current process (called in a fresh subprocess so
+    that the peak RSS belongs to that stage only) and return the measurement.
+    """
+    os.chdir(case_dir)
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    result = {'stage': stage, 'error': ''}
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with redirect_stdout(io.StringIO()):
+            if stage == 'main':
+                import automate_excel
+                if automate_excel.main(force=True, restart=True) is None:
+                    # main() gave up (e.g. a required column is missing): not a valid measurement
+                    result['error'] = "main() returned None"
+            else:
+                os.environ.setdefault('MPLBACKEND', 'Agg')
+                import delivery_analysis
+                delivery_analysis.analyze_delivery_performance()
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+
+    result['wall_time_s'] = round(time.perf_counter() - wall_start, 4)
+    result['cpu_time_s'] = round(time.process_time() - cpu_start, 4)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mib'] = round(max_rss / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+    return result
+
+def current_commit():
+    """Short hash of the checked-out commit, so results can be compared between commits"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).resolve().parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def parse_grid(grid):
+    """
+    Parse a size grid like '100x4,1000x8x2000' into [(rows, planning_files, jgal_files), ...].
+
+    The Planning count defaults to 4; without a jgal count (None) about 90%
+    of the rows get a jgal file.
+    """
+    sizes = []
+    for size in grid.split(','):
+        parts = size.strip().split('x')
+        num_planning = int(parts[1]) if len(parts) > 1 and parts[1] else 4
+        num_jgal = int(parts[2]) if len(parts) > 2 and parts[2] else None
+        sizes.append((int(parts[0]), num_planning, num_jgal))
+    return sizes
+
+def plot_curves(results, plot_file):
+    """Plot runtime and peak memory against the number of rows, one line per stage and Planning count"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, (ax_time, ax_memory) = plt.subplots(1, 2, figsize=(14, 5))
+    series = sorted({(r['stage'], r['planning_files']) for r in results if not r['error']})
+    for stage, num_planning in series:
+        points = sorted((r['rows'], r['wall_time_s'], r['peak_rss_mib']) for r in results
+                        if r['stage'] == stage and r['planning_files'] == num_planning and not r['error'])
+        label = f"{stage} ({num_planning} Planning files)"
+        ax_time.plot([p[0] for p in points], [p[1] for p in points], marker='o', label=label)
+        ax_memory.plot([p[0] for p in points], [p[2] for p in points], marker='o', label=label)
+
+    ax_time.set(xlabel='Rows', ylabel='Wall time (s)', title='Runtime', xscale='log', yscale='log')
+    ax_memory.set(xlabel='Rows', ylabel='Peak RSS (MiB)', title='Memory', xscale='log')
+    for ax in (ax_time, ax_memory):
+        ax.grid(True, alpha=0.3)
+        ax.legend(fontsize=8)
+    plt.tight_layout()
+    plt.savefig(plot_file, dpi=150)
+    print(f"[+] Saved: {plot_file}")
+
+def run_benchmark(sizes, results_file, repeat=1, plot_file=None, work_dir=None):
+    """
+    Generate inputs for every size, time main() and the delivery analysis, and append the results.
+
+    The inputs are generated in a temporary directory that is removed at the
+    end, or in work_dir (kept, one subfolder per size) when given.
+    """
+    commit = current_commit()
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    results = []
+
+    print("=" * 80)
+    print(f"PIPELINE BENCHMARK (commit {commit})")
+    print("=" * 80)
+
+    if work_dir:
+        Path(work_dir).mkdir(parents=True, exist_ok=True)
+        inputs = nullcontext(work_dir)
+    else:
+        inputs = tempfile.TemporaryDirectory(prefix='avanzamento_bench_')
+
+    with inputs as inputs_dir:
+        for num_rows, num_planning, num_jgal in sizes:
+            case_dir = Path(inputs_dir) / f"{num_rows}x{num_planning}" if num_jgal is None \
+                else Path(inputs_dir) / f"{num_rows}x{num_planning}x{num_jgal}"
+            if case_dir.exists():
+                shutil.rmtree(case_dir)  # Inputs kept by a previous run
+            generate_start = time.perf_counter()
+            num_jgal = generate_inputs(case_dir, num_rows, num_planning, num_jgal)
+            print(f"\n{num_rows} rows, {num_planning} Planning files, {num_jgal} jgal files "
+                  f"(generated in {time.perf_counter() - generate_start:.1f} s)")
+
+            for stage in ('main', 'delivery_analysis'):
+                for _ in range(repeat):
+                    child = subprocess.run([sys.executable, str(Path(__file__).resolve()), '--run-case',
+                                            str(case_dir), stage], capture_output=True, text=True)
+                    if child.returncode != 0:
+                        measurement = {'stage': stage, 'wall_time_s': '', 'cpu_time_s': '', 'peak_rss_mib': '',
+                                       'error': child.stderr.strip().splitlines()[-1] if child.stderr else 'failed'}
+                    else:
+                        measurement = json.loads(child.stdout.strip().splitlines()[-1])
+
+                    result = {'commit': commit, 'timestamp': timestamp, 'rows': num_rows,
+                              'planning_files': num_planning, 'jgal_files': num_jgal, **measurement}
+                    results.append(result)
+
+                    if result['error']:
+                        print(f"  {stage:<18} ERROR: {result['error']}")
+                    else:
+                        print(f"  {stage:<18} wall {result['wall_time_s']:8.2f} s  cpu {result['cpu_time_s']:8.2f} s  "
+                              f"peak RSS {result['peak_rss_mib']:8.1f} MiB")
+
+    # Results are appended, so runs of different commits end up in the same file
+    new_file = not Path(results_file).exists()
+    with open(results_file, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(results)
+    print(f"\n[+] Appended {len(results)} measurements to {results_file}")
+
+    if plot_file:
+        try:
+            plot_curves(results, plot_file)
+        except ImportError as e:
+            print(f"Could not plot curves: {e}")
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time automate_excel.main() and the delivery analysis on synthetic inputs")
+    parser.add_argument("--grid", default="100x4,1000x8,5000x16",
+                        help="Comma-separated sizes as ROWSxPLANNING_FILES[xJGAL_FILES]; without JGAL_FILES "
+                             "about 90%% of the rows get a jgal file (default: 100x4,1000x8,5000x16)")
+    parser.add_argument("--repeat", type=int, default=1, help="Measurements per size and stage (default: 1)")
+    parser.add_argument("--results", default="benchmark_results.csv",
+                        help="CSV file the measurements are appended to (default: benchmark_results.csv)")
+    parser.add_argument("--plot", default=None, help="Also plot runtime and memory curves to this PNG file")
+    parser.add_argument("--work-dir", default=None,
+                        help="Generate the inputs in this directory and keep them (default: a temporary "
+                             "directory removed at the end)")
+    parser.add_argument("--run-case", nargs=2, metavar=("CASE_DIR", "STAGE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(*args.run_case)))
+    else:
+        run_benchmark(parse_grid(args.grid), args.results, repeat=args.repeat, plot_file=args.plot,
+                      work_dir=args.work_dir)
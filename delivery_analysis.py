@@ -16,20 +16,30 @@ def analyze_delivery_performance():
     print("DELIVERY PERFORMANCE ANALYSIS")
     print("="*80)
 
-    # Find columns
+    # Find columns by exact header. The consolidated "Data prevista avanzamento" is the
+    # last column with that exact header (per-snapshot columns carry their date, and
+    # with a single Planning file both share it); it is directly followed by "Data
+    # effettiva avanzamento", then by any extra "(Sequenza N)" milestone columns.
     delta_col = None
     prevista_col = None
     effettiva_col = None
-    articolo_col = 1
+    articolo_col = None
 
     for col_idx in range(1, ws.max_column + 1):
         header = ws.cell(1, col_idx).value
         if header == "Delta":
             delta_col = col_idx
-        elif header == "Data prevista avanzamento" and col_idx == ws.max_column - 1:
+        elif header == "Data prevista avanzamento":
             prevista_col = col_idx
         elif header == "Data effettiva avanzamento":
             effettiva_col = col_idx
+        elif header == "Articolo":
+            articolo_col = col_idx
+
+    if not delta_col or not prevista_col or not effettiva_col or not articolo_col:
+        print("ERROR: Could not find 'Delta', 'Data prevista avanzamento', 'Data effettiva avanzamento' "
+              "or 'Articolo' column!")
+        return None
 
     # Collect data
     deltas = []
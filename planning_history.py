@@ -0,0 +1,215 @@
+import sqlite3
+import argparse
+from datetime import datetime
+
+# Append-only store of every Planning snapshot seen by automate_excel.py.
+# planning_rows holds one row per Planning data row; snapshots records which
+# Planning files were ingested, so each file is only read once.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_date TEXT PRIMARY KEY,
+    file_name     TEXT NOT NULL,
+    row_count     INTEGER NOT NULL,
+    ingested_at   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS planning_rows (
+    snapshot_date TEXT NOT NULL REFERENCES snapshots (snapshot_date),
+    matricola     TEXT,
+    articolo      TEXT,
+    rilascio_date TEXT
+);
+CREATE INDEX IF NOT EXISTS planning_rows_matricola ON planning_rows (matricola, snapshot_date);
+CREATE INDEX IF NOT EXISTS planning_rows_articolo ON planning_rows (articolo, snapshot_date);
+CREATE INDEX IF NOT EXISTS planning_rows_snapshot ON planning_rows (snapshot_date);
+"""
+
+def open_history(db_path):
+    """Open (and create if needed) the Planning history database"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def normalize_key(value):
+    """Matricola/Articolo as matched by automate_excel.py (stripped text), None if empty"""
+    if not value:
+        return None
+    return str(value).strip() or None
+
+def normalize_rilascio(value):
+    """
+    Store dates as ISO text (YYYY-MM-DD, with the time only if it is not
+    midnight) so they sort and compare as strings; other values ('KOM',
+    free text) are kept as text.
+    """
+    if value is None or value == '':
+        return None
+    if hasattr(value, 'hour') and (value.hour, value.minute, value.second) != (0, 0, 0):
+        return value.isoformat(sep=' ')
+    if hasattr(value, 'year'):
+        return value.strftime('%Y-%m-%d')
+    return str(value).strip()
+
+def ingested_snapshots(conn):
+    """Return the set of snapshot dates already in the store"""
+    return {row[0] for row in conn.execute("SELECT snapshot_date FROM snapshots")}
+
+def ingest_snapshot(conn, snapshot_date, file_name, rows):
+    """
+    Append one Planning snapshot to the store.
+
+    rows yields the raw (matricola, articolo, date) values of the Planning
+    file; rows without Matricola and Articolo are skipped. The snapshot is
+    written in one transaction. Returns the number of rows stored.
+    """
+    records = []
+    for matricola_value, articolo_value, date_value in rows:
+        matricola = normalize_key(matricola_value)
+        articolo = normalize_key(articolo_value)
+        if matricola or articolo:
+            records.append((snapshot_date, matricola, articolo, normalize_rilascio(date_value)))
+
+    with conn:
+        conn.execute("INSERT INTO snapshots (snapshot_date, file_name, row_count, ingested_at) VALUES (?, ?, ?, ?)",
+                     (snapshot_date, file_name, len(records), datetime.now().isoformat(timespec='seconds')))
+        conn.executemany("INSERT INTO planning_rows (snapshot_date, matricola, articolo, rilascio_date) "
+                         "VALUES (?, ?, ?, ?)", records)
+    return len(records)
+
+def missing_snapshots(db_path, planning_dates):
+    """Return the (snapshot_date, planning_file) pairs of planning_dates not in the store yet"""
+    conn = open_history(db_path)
+    try:
+        known = ingested_snapshots(conn)
+    finally:
+        conn.close()
+    return [(date, pf) for date, pf in planning_dates if date not in known]
+
+def update_history(db_path, planning_dates, read_rows):
+    """
+    Ingest the Planning files that are not in the store yet.
+
+    planning_dates is the list of (snapshot_date, planning_file) pairs found
+    by automate_excel.py and read_rows(planning_file) yields the raw rows of
+    a file. Returns the number of snapshots ingested.
+    """
+    conn = open_history(db_path)
+    try:
+        known = ingested_snapshots(conn)
+        new_snapshots = [(date, pf) for date, pf in planning_dates if date not in known]
+
+        for date, planning_file in new_snapshots:
+            row_count = ingest_snapshot(conn, date, planning_file.name, read_rows(planning_file))
+            print(f"    Stored {planning_file.name}: {row_count} rows")
+
+        print(f"Planning history ({db_path}): {len(new_snapshots)} new snapshots ingested, "
+              f"{len(planning_dates) - len(new_snapshots)} already stored")
+        return len(new_snapshots)
+    finally:
+        conn.close()
+
+def slip_history(conn, matricola=None, articolo=None):
+    """
+    Return the Rilascio trajectory of a Matricola (or Articolo) as a list of
+    (snapshot_date, rilascio_date) pairs, oldest snapshot first.
+    """
+    if matricola:
+        key_column, key = 'matricola', matricola
+    elif articolo:
+        key_column, key = 'articolo', articolo
+    else:
+        raise ValueError("Either matricola or articolo is required")
+
+    return conn.execute(f"SELECT snapshot_date, rilascio_date FROM planning_rows "
+                        f"WHERE {key_column} = ? ORDER BY snapshot_date, rowid", (key.strip(),)).fetchall()
+
+def count_moves(trajectory):
+    """Number of times the Rilascio date changed between consecutive snapshots"""
+    values = [rilascio_date for _, rilascio_date in trajectory]
+    return sum(1 for previous, current in zip(values, values[1:]) if previous != current)
+
+def top_slippers(conn, limit=20):
+    """
+    Return the Matricole whose Rilascio date moved most often, as
+    (matricola, moves, first_date, last_date) tuples.
+    """
+    return conn.execute("""
+        WITH trajectory AS (
+            SELECT matricola, rilascio_date,
+                   LAG(rilascio_date) OVER by_snapshot AS previous_date,
+                   ROW_NUMBER() OVER by_snapshot AS position,
+                   FIRST_VALUE(rilascio_date) OVER by_snapshot AS first_date,
+                   FIRST_VALUE(rilascio_date) OVER (PARTITION BY matricola
+                                                    ORDER BY snapshot_date DESC, rowid DESC) AS last_date
+            FROM planning_rows
+            WHERE matricola IS NOT NULL
+            WINDOW by_snapshot AS (PARTITION BY matricola ORDER BY snapshot_date, rowid)
+        )
+        SELECT matricola,
+               SUM(position > 1 AND previous_date IS NOT rilascio_date) AS moves,
+               MIN(first_date),
+               MIN(last_date)
+        FROM trajectory
+        GROUP BY matricola
+        HAVING moves > 0
+        ORDER BY moves DESC, matricola
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+def snapshot_view(conn, snapshot_date):
+    """Return the (matricola, articolo, rilascio_date) rows of a past snapshot"""
+    return conn.execute("SELECT matricola, articolo, rilascio_date FROM planning_rows "
+                        "WHERE snapshot_date = ? ORDER BY rowid", (snapshot_date,)).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the Planning history store built by automate_excel.py --history-db")
+    parser.add_argument("db", help="Planning history database (e.g. planning_history.sqlite)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("snapshots", help="List the stored snapshots")
+
+    slips = subparsers.add_parser("slips", help="Rilascio trajectory of one Matricola or Articolo")
+    key = slips.add_mutually_exclusive_group(required=True)
+    key.add_argument("--matricola")
+    key.add_argument("--articolo")
+
+    top = subparsers.add_parser("top", help="Matricole whose Rilascio date moved most often")
+    top.add_argument("--limit", type=int, default=20)
+
+    view = subparsers.add_parser("view", help="Rows of a past snapshot")
+    view.add_argument("snapshot_date", help="Snapshot date (YYYY-MM-DD)")
+
+    args = parser.parse_args()
+    conn = open_history(args.db)
+
+    if args.command == "snapshots":
+        for snapshot_date, file_name, row_count, ingested_at in conn.execute(
+                "SELECT snapshot_date, file_name, row_count, ingested_at FROM snapshots ORDER BY snapshot_date"):
+            print(f"{snapshot_date}  {file_name}  {row_count} rows  (ingested {ingested_at})")
+
+    elif args.command == "slips":
+        trajectory = slip_history(conn, matricola=args.matricola, articolo=args.articolo)
+        if not trajectory:
+            print("No rows found")
+            return
+        previous = None
+        for snapshot_date, rilascio_date in trajectory:
+            marker = "  <- moved" if previous is not None and rilascio_date != previous else ""
+            print(f"{snapshot_date}: {rilascio_date}{marker}")
+            previous = rilascio_date
+        print(f"\nRilascio date moved {count_moves(trajectory)} times over {len(trajectory)} snapshots")
+
+    elif args.command == "top":
+        print(f"{'Matricola':<20} {'Moves':>5}  {'First':<12} {'Last':<12}")
+        for matricola, moves, first_date, last_date in top_slippers(conn, args.limit):
+            print(f"{matricola:<20} {moves:>5}  {str(first_date):<12} {str(last_date):<12}")
+
+    elif args.command == "view":
+        rows = snapshot_view(conn, args.snapshot_date)
+        for matricola, articolo, rilascio_date in rows:
+            print(f"{str(matricola):<20} {str(articolo):<20} {rilascio_date}")
+        print(f"\n{len(rows)} rows")
+
+    conn.close()
+
+if __name__ == "__main__":
+    main()
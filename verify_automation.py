@@ -0,0 +1,241 @@
+import openpyxl
+import argparse
+import sys
+from pathlib import Path
+
+PREVISTA_HEADER = "Data prevista avanzamento"
+EFFETTIVA_HEADER = "Data effettiva avanzamento"
+
+def resolve_columns(headers):
+    """
+    Find the columns of the output by header (0-based indices into a row).
+
+    The consolidated column is the one headed exactly "Data prevista
+    avanzamento" after the per-snapshot "Data prevista avanzamento (...)"
+    columns; with a single Planning file both share that header, so the last
+    one is taken.
+    """
+    columns = {'articolo': None, 'revisione': None, 'matricola': None, 'delta': None,
+               'consolidated': None, 'effettiva': None, 'planning': []}
+
+    for col_idx, header in enumerate(headers):
+        header = str(header).strip() if header is not None else ''
+        if header == "Articolo":
+            columns['articolo'] = col_idx
+        elif header == "Revisione":
+            columns['revisione'] = col_idx
+        elif header == "Matricola":
+            columns['matricola'] = col_idx
+        elif header == "Delta":
+            columns['delta'] = col_idx
+        elif header == PREVISTA_HEADER:
+            if columns['consolidated'] is not None:
+                columns['planning'].append(columns['consolidated'])
+            columns['consolidated'] = col_idx
+        elif header.startswith(f"{PREVISTA_HEADER} ("):
+            columns['planning'].append(col_idx)
+        elif header == EFFETTIVA_HEADER:
+            columns['effettiva'] = col_idx
+
+    return columns
+
+def is_date(value):
+    """True for datetime cell values (not 'KOM' or other text)"""
+    return value is not None and hasattr(value, 'year')
+
+def last_valid_planning_date(row, planning_cols):
+    """The expected consolidated value: the last Planning date of the row, ignoring 'KOM' and text"""
+    for col_idx in reversed(planning_cols):
+        value = row[col_idx]
+        if value and is_date(value):
+            return value
+    return None
+
+def short(value):
+    """Cell value for the report (dates without the time)"""
+    if value is None:
+        return "None"
+    return str(value)[:10] if is_date(value) else str(value)
+
+def verify_automation(output_file, max_examples=10):
+    """
+    Verify Avanzamento_schede_automated.xlsx in one read-only pass.
+
+    Checks that the expected columns exist, that the consolidated column
+    holds the last valid Planning date of each row, and that Delta equals
+    Data effettiva - Data prevista in days; collects the fill statistics
+    and samples of the previous verify_*/final_verification/summary_report
+    scripts. Returns the list of failures.
+    """
+    wb = openpyxl.load_workbook(output_file, read_only=True)
+    ws = wb.active
+
+    failures = []
+    warnings = []
+
+    print("=" * 80)
+    print(f"AUTOMATION VERIFICATION: {output_file}")
+    print("=" * 80)
+
+    rows = ws.iter_rows(values_only=True)
+    headers = list(next(rows, ()))
+    columns = resolve_columns(headers)
+
+    for name, header in (('articolo', "Articolo"), ('matricola', "Matricola"), ('delta', "Delta"),
+                         ('consolidated', PREVISTA_HEADER), ('effettiva', EFFETTIVA_HEADER)):
+        if columns[name] is None:
+            failures.append(f"Column '{header}' not found")
+    if failures:
+        wb.close()
+        print_failures(failures)
+        return failures
+
+    planning_cols = columns['planning']
+    consolidated_col = columns['consolidated']
+    effettiva_col = columns['effettiva']
+    delta_col = columns['delta']
+
+    total_rows = 0
+    consolidated_filled = 0
+    effettiva_filled = 0
+    delta_filled = 0
+    delta_positive = 0
+    delta_zero = 0
+    delta_negative = 0
+    consolidated_mismatches = 0
+    delta_mismatches = 0
+    samples = []
+    rows_without_consolidated = []
+    width = len(headers)
+
+    # Single pass over the data rows
+    for row_idx, row in enumerate(rows, 2):
+        if len(row) < width:  # Short rows are not padded by the read-only reader
+            row = tuple(row) + (None,) * (width - len(row))
+        total_rows += 1
+
+        consolidated = row[consolidated_col]
+        effettiva = row[effettiva_col]
+        delta = row[delta_col]
+
+        if consolidated:
+            consolidated_filled += 1
+        elif len(rows_without_consolidated) < max_examples:
+            planning_dates = [short(row[col_idx]) for col_idx in planning_cols if row[col_idx]]
+            rows_without_consolidated.append((row_idx, row[columns['articolo']], row[columns['matricola']],
+                                              planning_dates))
+        if effettiva:
+            effettiva_filled += 1
+
+        # Consolidated = last valid Planning date (only checkable when the Planning columns are present)
+        if planning_cols:
+            expected = last_valid_planning_date(row, planning_cols)
+            if expected != (consolidated or None):
+                consolidated_mismatches += 1
+                if consolidated_mismatches <= max_examples:
+                    failures.append(f"Row {row_idx}: consolidated is {short(consolidated)}, "
+                                    f"last valid Planning date is {short(expected)}")
+
+        # Delta = Data effettiva - Data prevista, in days
+        if isinstance(delta, (int, float)) and not isinstance(delta, bool):
+            delta_filled += 1
+            if delta > 0:
+                delta_positive += 1
+            elif delta < 0:
+                delta_negative += 1
+            else:
+                delta_zero += 1
+
+        if is_date(consolidated) and is_date(effettiva):
+            expected_delta = (effettiva - consolidated).days
+            if delta != expected_delta:
+                delta_mismatches += 1
+                if delta_mismatches <= max_examples:
+                    failures.append(f"Row {row_idx}: Delta is {delta}, expected {expected_delta} "
+                                    f"({short(effettiva)} - {short(consolidated)})")
+        elif isinstance(delta, (int, float)) and len(warnings) < max_examples:
+            warnings.append(f"Row {row_idx}: Delta {delta} without both dates")
+
+        if len(samples) < 5:
+            samples.append((row_idx, row[columns['articolo']],
+                            row[columns['revisione']] if columns['revisione'] is not None else None,
+                            consolidated, effettiva, delta))
+
+    wb.close()
+
+    if consolidated_mismatches > max_examples:
+        failures.append(f"... {consolidated_mismatches - max_examples} more consolidated mismatches")
+    if delta_mismatches > max_examples:
+        failures.append(f"... {delta_mismatches - max_examples} more Delta mismatches")
+
+    def pct(count):
+        return f"{count / total_rows * 100:.1f}%" if total_rows else "n/a"
+
+    # Structure
+    print(f"\nTotal columns: {width}, total data rows: {total_rows}")
+    print(f"  Planning date columns: {len(planning_cols)}", end="")
+    if planning_cols:
+        print(f" ({headers[planning_cols[0]]} ... {headers[planning_cols[-1]]})")
+    else:
+        print(" (consolidated-only output, consolidated column not cross-checked)")
+    print(f"  Consolidated '{PREVISTA_HEADER}': column {consolidated_col + 1}")
+    print(f"  '{EFFETTIVA_HEADER}': column {effettiva_col + 1}")
+    print(f"  Delta: column {delta_col + 1}")
+
+    # Fill statistics
+    print(f"\nConsolidated '{PREVISTA_HEADER}':")
+    print(f"  Filled: {consolidated_filled} ({pct(consolidated_filled)})")
+    print(f"  Empty: {total_rows - consolidated_filled} ({pct(total_rows - consolidated_filled)})")
+    print(f"'{EFFETTIVA_HEADER}':")
+    print(f"  Filled: {effettiva_filled} ({pct(effettiva_filled)})")
+    print(f"  Empty: {total_rows - effettiva_filled} ({pct(total_rows - effettiva_filled)})")
+    print("Delta:")
+    print(f"  Filled: {delta_filled} ({pct(delta_filled)})")
+    print(f"  Positive (late): {delta_positive}, zero (on time): {delta_zero}, negative (early): {delta_negative}")
+
+    if rows_without_consolidated:
+        print(f"\nFirst {len(rows_without_consolidated)} rows without consolidated date:")
+        for row_idx, articolo, matricola, planning_dates in rows_without_consolidated:
+            found = (f"{len(planning_dates)} Planning values: {', '.join(sorted(set(planning_dates))[:5])}"
+                     if planning_dates else "no Planning values")
+            print(f"  Row {row_idx}: Articolo={articolo}, Matricola={matricola} ({found})")
+
+    print(f"\nSample data (first {len(samples)} rows):")
+    print(f"{'Row':<5} {'Articolo':<25} {'Rev':<5} {'Data Prev':<12} {'Data Eff':<12} {'Delta':<8}")
+    print("-" * 80)
+    for row_idx, articolo, revisione, consolidated, effettiva, delta in samples:
+        print(f"{row_idx:<5} {str(articolo)[:24]:<25} {revisione!s:<5} {short(consolidated):<12} "
+              f"{short(effettiva):<12} {delta!s:<8}")
+
+    if warnings:
+        print("\nWarnings:")
+        for warning in warnings:
+            print(f"  - {warning}")
+
+    print_failures(failures)
+    return failures
+
+def print_failures(failures):
+    """Print the verdict of the verification"""
+    print("\n" + "=" * 80)
+    if failures:
+        print(f"VERIFICATION FAILED ({len(failures)} problems)")
+        for failure in failures:
+            print(f"  - {failure}")
+    else:
+        print("VERIFICATION PASSED")
+    print("=" * 80)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify Avanzamento_schede_automated.xlsx in a single read-only pass")
+    parser.add_argument("output_file", nargs="?", default="Avanzamento_schede_automated.xlsx",
+                        help="Output workbook to verify (default: Avanzamento_schede_automated.xlsx)")
+    parser.add_argument("--max-examples", type=int, default=10,
+                        help="Rows listed per problem or sample section (default: 10)")
+    args = parser.parse_args()
+
+    if not Path(args.output_file).exists():
+        print(f"ERROR: {args.output_file} not found")
+        sys.exit(2)
+
+    sys.exit(1 if verify_automation(args.output_file, args.max_examples) else 0)